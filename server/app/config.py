@@ -1,23 +1,88 @@
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
+from typing import Literal, Optional
 import os
 
 
+class LLMRoute(BaseModel):
+    models: list[str]  # tried in order, the next one if the previous failed or timed out
+    timeout: Optional[float] = None  # seconds per call, the queue wait excluded
+
+
 class Settings(BaseSettings):
     mode: str
     postgres_password: str = os.getenv("POSTGRES_PASSWORD")
     postgres_host: str = os.getenv("POSTGRES_HOST")
     postgres_user: str = os.getenv("POSTGRES_USER")
     postgres_db: str = os.getenv("POSTGRES_DB")
+    # Connection pool shared by the app database engine and the checkpointer
+    db_pool_size: int = 10  # max connections per worker
+    db_pool_min_size: int = 2
+    db_checkpointer_connections: int = 1  # reserved for the checkpointer, the app gets the rest
+    db_max_overflow: int = 10  # sync engine only
+    db_pool_timeout: int = 30  # seconds to wait for a connection before failing
+    db_pool_recycle: int = 1800  # seconds before a connection is replaced
+    db_pool_pre_ping: bool = True  # check connections are alive before using them
     secret_key: str
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    principal_cache_size: int = 1024  # authenticated users cached per worker
+    principal_cache_ttl: int = 60  # seconds before a cached user is read from the database again
+    password_hash_workers: int = 2  # concurrent argon2 hashes per worker, 64 MiB each
+    password_hash_queue_size: int = 32  # hashes waiting for a thread before rejecting logins with 503
     mistral_api_key: str
     hf_token: str  # required for tokenizer to work
+    chatbot_history_token_budget: int = 2000  # tokens of conversation history sent in the prompts
+    chatbot_graph_debug: bool = False  # print every graph step (slow, dev only)
+    intent_classifier_path: Optional[str] = None  # local intent classifier artifact, LLM only if unset
+    intent_classifier_threshold: float = 0.8  # below this confidence the LLM decides the intent
+    # Response cache of the chat model, for the prompt templates listed (see services/chatbot/llm_cache.py)
+    llm_cache_enabled: bool = True
+    llm_cache_templates: list[str] = [
+        "intent", "intent_with_details", "invoice_extraction", "email_extraction", "email_satisfaction",
+        "email_summary", "email_draft"
+    ]
+    llm_cache_semantic_templates: list[str] = []  # also matched by similarity (eg: ["intent"])
+    llm_cache_similarity_threshold: float = 0.95  # cosine similarity of a semantic match at least
+    llm_cache_ttl: int = 7 * 24 * 3600  # seconds before a cached response expires
+    llm_cache_size: int = 1024  # responses kept in process
+    llm_cache_max_rows: int = 100_000  # responses kept in the database, the oldest are evicted
+    # Scheduling of the chat model calls, by priority and user (see services/chatbot/llm_scheduler.py)
+    llm_max_concurrency: int = 8  # calls in flight at most, halved on each rate limited (429) call
+    llm_requests_per_minute: int = 300  # provider request quota
+    llm_tokens_per_minute: int = 500_000  # provider token quota
+    llm_max_retries: int = 3  # retries of a rate limited call
+    llm_max_backoff: float = 60  # seconds of pause after consecutive rate limited calls at most
+    # Models of each task class (see services/chatbot/llm_router.py), the other calls use mistral-small-latest
+    llm_routes: dict[str, LLMRoute] = {
+        "classification": LLMRoute(models=["ministral-8b-latest", "mistral-small-latest"], timeout=10),
+        "extraction": LLMRoute(models=["mistral-small-latest", "ministral-8b-latest"], timeout=20),
+        "summarisation": LLMRoute(models=["mistral-small-latest", "ministral-8b-latest"], timeout=30),
+        "generation": LLMRoute(models=["mistral-medium-latest", "mistral-small-latest"], timeout=60),
+    }
+    # USD per million input and output tokens of the models, for the cost metrics
+    llm_model_prices: dict[str, tuple[float, float]] = {
+        "ministral-8b-latest": (0.1, 0.1),
+        "mistral-small-latest": (0.1, 0.3),
+        "mistral-medium-latest": (0.4, 2.0),
+    }
+    # How the email subject and body are generated: two concurrent calls, or one structured call
+    email_generation_mode: Literal["concurrent", "structured"] = "concurrent"
 
     google_client_id: str
     google_client_secret: str
     google_redirect_uri: str
+    gmail_sync_max_messages: int = 100  # latest messages imported by the first sync of a user
+    summary_batch_size: int = 100  # emails read and summarised per batch by the summarisation pipeline
+    summary_concurrency: int = 4  # concurrent LLM calls of the summarisation pipeline
+    # Background sync of the connected users' inboxes
+    inbox_sync_enabled: bool = True
+    inbox_sync_interval: int = 300  # seconds between two syncs of a user
+    inbox_sync_jitter: float = 0.2  # the interval varies by +/- this fraction
+    inbox_sync_workers: int = 4  # users synced concurrently
+    inbox_sync_rate: float = 2.0  # syncs started per second at most, for the Google API quotas
+    inbox_sync_max_backoff: int = 3600  # seconds between the retries of a failing user at most
 
     model_config = SettingsConfigDict(
         env_file=(
@@ -1,20 +1,98 @@
-from typing import Annotated
+import asyncio
+import json
+import sys
+import time
+from functools import cache
+from typing import Annotated, AsyncIterator
 
 from fastapi import Depends
+from sqlalchemy import Engine, event
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.config import get_settings
+from app.db.pool import get_app_connection, get_connection_pool, release_app_connection
+from app.utils import metrics
 
 
-def get_sqlmodel_engine():
+def get_db_url(driver: str = "postgresql") -> str:
     """
-    Returns a sqlmodel engine connection
-    :return:
+    Returns the database url for the given sqlalchemy `driver`
     """
     settings = get_settings()
+    return f"{driver}://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:5432/{settings.postgres_db}"
+
+
+def get_pool_options() -> dict:
+    settings = get_settings()
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+@cache
+def get_sqlmodel_engine() -> Engine:
+    """
+    Returns the process-wide sync sqlmodel engine, and its connection pool.
+    Prefer the async engine in the routers and services, not to block the event loop.
+    :return:
+    """
+    return create_engine(get_db_url(), **get_pool_options())
 
-    return create_engine(
-        f"postgresql://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:5432/{settings.postgres_db}",
+
+@cache
+def get_async_engine() -> AsyncEngine:
+    """
+    Returns the process-wide async sqlmodel engine (psycopg 3).
+    Its connections come from the pool shared with the checkpointer (see db/pool.py), so the engine
+    doesn't keep a pool of its own. Disposed on shutdown with dispose_engines.
+    """
+    engine = create_async_engine(
+        "postgresql+psycopg://",
+        async_creator=get_app_connection,
+        poolclass=NullPool,
+        # Turns autocommit off (the shared pool's default) while the engine uses the connection
+        isolation_level="READ COMMITTED",
     )
+    event.listen(engine.sync_engine, "close", release_app_connection)
+    event.listen(engine.sync_engine, "close_detached", release_app_connection)
+    return engine
+
+
+async def dispose_engines():
+    """
+    Closes all the connections of the engines' pools
+    """
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+        get_async_engine.cache_clear()
+    if get_sqlmodel_engine.cache_info().currsize:
+        get_sqlmodel_engine().dispose()
+        get_sqlmodel_engine.cache_clear()
+
+
+def get_pool_stats(engine) -> dict | None:
+    """
+    Returns the utilisation of the `engine`'s connection pool, None if the engine was never created
+    """
+    if not engine.cache_info().currsize:
+        return None
+
+    pool = engine().pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
+
+metrics.register_gauge("db.sync_pool", lambda: get_pool_stats(get_sqlmodel_engine))
 
 
 def get_sqlmodel_session():
@@ -25,5 +103,94 @@ def get_sqlmodel_session():
         yield session
 
 
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """
+    Yields an async sqlmodel session.
+    Objects are not expired on commit, as lazy loading them again is not possible with async.
+    """
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
 # Alias for session dependency since it is so common
 SessionDep = Annotated[Session, Depends(get_sqlmodel_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+
+
+async def benchmark(concurrency: int, requests: int) -> dict:
+    """
+    Load of GET /users/me, `concurrency` requests at a time, with a new engine per request (as before the
+    shared engine) vs the shared engine, the principal cache bypassed vs as served:
+
+        python -m app.db.connection benchmark [<concurrency> <requests>]
+    """
+    from datetime import timedelta
+    from uuid import uuid4
+
+    import httpx
+
+    from app.main import app
+    from app.schemas.app import User
+    from app.services import users
+    from app.services.auth import create_access_token
+
+    async def session_per_request_engine() -> AsyncIterator[AsyncSession]:
+        engine = create_async_engine(get_db_url("postgresql+psycopg"))
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                yield session
+        finally:
+            await engine.dispose()
+
+    async with get_connection_pool():
+        user = User(email=f"benchmark-{uuid4()}@example.com", name="Benchmark", saltpassword="x")
+        async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+            await users.add_one(session, user)
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': user.email}, timedelta(minutes=10))}"}
+
+        results = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name in ("engine_per_request", "shared_engine", "shared_engine_cached"):
+                if name == "engine_per_request":
+                    app.dependency_overrides[get_async_session] = session_per_request_engine
+                latencies = []
+
+                async def worker(count: int):
+                    for _ in range(count):
+                        if name != "shared_engine_cached":
+                            users.get_principal_cache().invalidate(user.email)
+                        start = time.perf_counter()
+                        response = await client.get("/users/me", headers=headers)
+                        latencies.append(time.perf_counter() - start)
+                        response.raise_for_status()
+
+                start = time.perf_counter()
+                await asyncio.gather(*[
+                    worker(requests // concurrency + (i < requests % concurrency)) for i in range(concurrency)
+                ])
+                elapsed = time.perf_counter() - start
+                app.dependency_overrides.clear()
+
+                latencies.sort()
+                results[name] = {
+                    "requests_per_second": requests / elapsed,
+                    "p50_ms": latencies[len(latencies) // 2] * 1000,
+                    "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+                }
+
+        async with AsyncSession(get_async_engine()) as session:
+            await session.delete(await session.get(User, user.user_id))
+            await session.commit()
+        await dispose_engines()
+
+    return {"concurrency": concurrency, "requests": requests, **results}
+
+
+if __name__ == "__main__":
+    command, *args = sys.argv[1:]
+    if command == "benchmark":
+        concurrency, requests = (int(arg) for arg in (args + ["16", "1000"][len(args):]))
+        print(json.dumps(asyncio.run(benchmark(concurrency, requests)), indent=2))
+    else:
+        raise SystemExit(f"Unknown command: {command}")
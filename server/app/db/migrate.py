@@ -0,0 +1,76 @@
+"""
+Schema migrations, applied on top of dataloader/schema/init.sql.
+
+Migrations are the numbered sql files of app/db/migrations (eg: 001_indexes.sql), applied in order, each in
+its own transaction, and recorded in the schema_migration table. They run on startup (in the app lifespan),
+under an advisory lock so that only one worker applies them, or by hand:
+
+    python -m app.db.migrate
+"""
+import asyncio
+import logging
+import os
+
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_PATH = "app/db/migrations"
+
+# Arbitrary key of the advisory lock taken while migrating
+MIGRATION_LOCK_ID = 7_416_120
+
+
+def list_migrations() -> list[tuple[str, str]]:
+    """
+    Returns the (version, path) of the migration files, ordered by version
+    """
+    files = sorted(name for name in os.listdir(MIGRATIONS_PATH) if name.endswith(".sql"))
+    return [(name.removesuffix(".sql"), os.path.join(MIGRATIONS_PATH, name)) for name in files]
+
+
+async def apply_migrations(conn: AsyncConnection) -> list[str]:
+    """
+    Applies the migrations not applied yet on `conn` (in autocommit mode). Returns their versions.
+    """
+    # Locked first, concurrent CREATE TABLE IF NOT EXISTS can fail on the catalog unique constraints
+    await conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    try:
+        await conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migration "
+            "(version TEXT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        )
+        cursor = await conn.execute("SELECT version FROM schema_migration")
+        applied = {row[0] for row in await cursor.fetchall()}
+
+        versions = []
+        for version, path in list_migrations():
+            if version in applied:
+                continue
+            with open(path) as file:
+                sql = file.read()
+
+            logger.info(f"Applying migration {version}")
+            async with conn.transaction():
+                await conn.execute(sql, prepare=False)
+                await conn.execute("INSERT INTO schema_migration (version) VALUES (%s)", (version,))
+            versions.append(version)
+        return versions
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+
+
+async def migrate(pool: AsyncConnectionPool) -> list[str]:
+    async with pool.connection() as conn:
+        return await apply_migrations(conn)
+
+
+if __name__ == "__main__":
+    from app.db.pool import get_connection_pool
+
+    async def main():
+        async with get_connection_pool() as pool:
+            print(f"Applied migrations: {await migrate(pool) or 'none'}")
+
+    asyncio.run(main())
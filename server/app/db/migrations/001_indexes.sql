@@ -0,0 +1,13 @@
+--- One email per user, also indexes the auth lookups ---
+ALTER TABLE app_user ADD CONSTRAINT app_user_email_key UNIQUE (email);
+
+--- Foreign keys used in lookups and joins ---
+-- GET /emails filters by user, and lists or range-scans them by date
+CREATE INDEX IF NOT EXISTS email_user_id_timestamp_idx ON email (user_id, email_timestamp);
+CREATE INDEX IF NOT EXISTS task_email_id_idx ON task (email_id);
+CREATE INDEX IF NOT EXISTS invoice_creator_id_idx ON invoice (creator_id);
+
+--- Email dates were stored as text ---
+ALTER TABLE email
+    ALTER COLUMN email_timestamp TYPE TIMESTAMPTZ
+    USING NULLIF(email_timestamp, '')::TIMESTAMPTZ;
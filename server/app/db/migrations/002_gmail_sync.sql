@@ -0,0 +1,13 @@
+--- Gmail ids of the synced emails, a message is stored once per user ---
+ALTER TABLE email
+    ADD COLUMN gmail_message_id TEXT,
+    ADD COLUMN gmail_thread_id TEXT;
+ALTER TABLE email ADD CONSTRAINT email_user_id_gmail_message_id_key UNIQUE (user_id, gmail_message_id);
+
+--- Per-user Gmail history cursor of the incremental sync ---
+CREATE TABLE IF NOT EXISTS gmail_sync
+(
+    user_id    UUID PRIMARY KEY REFERENCES app_user,
+    history_id BIGINT      NOT NULL,
+    synced_at  TIMESTAMPTZ NOT NULL
+);
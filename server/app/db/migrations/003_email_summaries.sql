@@ -0,0 +1,13 @@
+--- Summaries by hash of the normalised email content, so the same content is summarised once ---
+CREATE TABLE IF NOT EXISTS email_summary
+(
+    content_hash TEXT PRIMARY KEY,
+    summary      TEXT        NOT NULL,
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE email ADD COLUMN content_hash TEXT;
+
+-- Emails left to summarise
+CREATE INDEX IF NOT EXISTS email_unsummarised_idx ON email (email_id)
+    WHERE summary IS NULL AND full_content IS NOT NULL;
@@ -0,0 +1,15 @@
+--- Response cache of the chat model, see services/chatbot/llm_cache.py ---
+CREATE TABLE IF NOT EXISTS llm_cache
+(
+    cache_key  TEXT PRIMARY KEY,  -- hash of the model parameters and the prompt
+    template   TEXT         NOT NULL,
+    llm_hash   TEXT         NOT NULL,  -- hash of the model parameters only, semantic lookups match it
+    response   TEXT         NOT NULL,  -- serialised generations
+    tokens     INTEGER      NOT NULL,
+    embedding  VECTOR(1024),  -- of the prompt, for the templates with a semantic cache
+    created_at TIMESTAMPTZ  NOT NULL DEFAULT now(),
+    expires_at TIMESTAMPTZ  NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS llm_cache_expires_at_idx ON llm_cache (expires_at);
+CREATE INDEX IF NOT EXISTS llm_cache_embedding_idx ON llm_cache USING hnsw (embedding vector_cosine_ops);
@@ -0,0 +1,115 @@
+import asyncio
+from functools import cache
+
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+from app.config import get_settings
+from app.utils import metrics
+
+
+class PooledConnection(AsyncConnection):
+    """
+    Connection of the shared pool.
+    Closing it while it is checked out (eg: by sqlalchemy) returns it to the pool instead.
+    """
+
+    async def close(self) -> None:
+        pool = getattr(self, "_pool", None)
+        if pool is None or self.closed:
+            await super().close()
+        else:
+            await pool.putconn(self)
+
+
+async def _reset_connection(conn: AsyncConnection) -> None:
+    # The checkpointer needs autocommit, the app database engine turns it off while using the connection
+    await conn.set_autocommit(True)
+
+
+@cache
+def get_connection_pool() -> AsyncConnectionPool:
+    """
+    Returns the process-wide postgres connection pool, shared by the LangGraph checkpointer and the
+    async app database engine, so the connections per worker are bounded by DB_POOL_SIZE.
+    Opened on startup and closed on shutdown, in the app lifespan.
+    """
+    settings = get_settings()
+
+    return AsyncConnectionPool(
+        f"postgresql://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:5432/{settings.postgres_db}",
+        connection_class=PooledConnection,
+        kwargs={"autocommit": True, "prepare_threshold": 0},
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_size,
+        timeout=settings.db_pool_timeout,
+        max_lifetime=settings.db_pool_recycle,
+        check=AsyncConnectionPool.check_connection if settings.db_pool_pre_ping else None,
+        reset=_reset_connection,
+        open=False,
+    )
+
+
+class ConnectionLimiter:
+    """
+    Limits how many connections of the shared pool a subsystem holds at once
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> None:
+        await self._semaphore.acquire()
+        self.in_use += 1
+
+    def release(self) -> None:
+        self.in_use -= 1
+        self._semaphore.release()
+
+
+@cache
+def get_app_connection_limiter() -> ConnectionLimiter:
+    """
+    Limits the connections of the shared pool held by the app database engine.
+    The rest is reserved for the checkpointer (which runs its queries one at a time, on one connection).
+    """
+    settings = get_settings()
+    return ConnectionLimiter(settings.db_pool_size - settings.db_checkpointer_connections)
+
+
+async def get_app_connection() -> AsyncConnection:
+    """
+    Checks out a connection of the shared pool for the app database engine.
+    Its slot is released by release_app_connection when the engine closes it.
+    """
+    limiter = get_app_connection_limiter()
+    await limiter.acquire()
+    try:
+        return await get_connection_pool().getconn()
+    except BaseException:
+        limiter.release()
+        raise
+
+
+def release_app_connection(*args) -> None:
+    get_app_connection_limiter().release()
+
+
+def get_connection_pool_stats() -> dict | None:
+    """
+    Returns the utilisation of the shared pool, None if it was never created
+    """
+    if not get_connection_pool.cache_info().currsize:
+        return None
+
+    limiter = get_app_connection_limiter()
+    return {
+        **get_connection_pool().get_stats(),
+        "app_connections": limiter.in_use,
+        "app_limit": limiter.limit,
+    }
+
+
+metrics.register_gauge("db.pool", get_connection_pool_stats)
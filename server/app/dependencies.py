@@ -4,7 +4,7 @@ from jwt.exceptions import InvalidTokenError
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 
-from app.db.connection import SessionDep
+from app.db.connection import AsyncSessionDep
 from app.config import get_settings
 from app.schemas.app import User
 import app.services.users as users
@@ -26,11 +26,12 @@ async def get_token_cookie_or_oauth2(request: Request):
 
 async def get_current_user(
     token: Annotated[str, Depends(get_token_cookie_or_oauth2)],
-    session: SessionDep,
+    session: AsyncSessionDep,
 ) -> User:
     """
     Use as dependency for any api endpoint that require authentication.
     Will return the user's db record if exist, else throws.
+    The record comes from the principal cache when possible, so it must not be modified.
     """
 
     credentials_exception = HTTPException(
@@ -52,7 +53,7 @@ async def get_current_user(
         # Auto throw if the token expired
         raise credentials_exception
 
-    user = users.find_one(session, email)
+    user = await users.find_authenticated(session, email)
     if user is None:
         raise credentials_exception
 
@@ -1,23 +1,48 @@
 from typing import Annotated
 
-from fastapi import FastAPI, Depends, status, HTTPException
+from fastapi import FastAPI, Depends, Request, status, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
-from .db.connection import get_sqlmodel_session
-from .routers import user, chatbot, oauth, email, task
+from .db.connection import get_async_engine, dispose_engines
+from .db.pool import get_connection_pool
+from .db.migrate import migrate
+from .routers import user, chatbot, oauth, email, task, metrics
 
 from .config import Settings, get_settings
 from app.services.chatbot.checkpointer import initialise_checkpointer
+from app.services.chatbot.graph import GraphRegistry
+from app.services.chatbot.memory import get_tokenizer
+from app.services.password_hashing import PasswordHashingBusy
+from app.services.inbox_sync import InboxSyncScheduler
 
 
 # make global version of llm and graph in here (app.state)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # One connection pool for the whole process, shared by the checkpointer and the database engine
+    pool = get_connection_pool()
+    await pool.open()
+    await migrate(pool)
+    get_async_engine()
+
     # Initialise the checkpointer and store it in app state
-    async with initialise_checkpointer() as cp:
+    async with initialise_checkpointer(pool) as cp:
         app.state.checkpointer = cp
+        # Compile the chatbot graph once, reused by every chat turn
+        app.state.graph_registry = GraphRegistry(checkpointer=cp)
+        # Load the tokenizer now rather than during the first chat turn
+        get_tokenizer()
+
+        app.state.inbox_sync = InboxSyncScheduler()
+        if get_settings().inbox_sync_enabled:
+            await app.state.inbox_sync.start()
         yield
+        await app.state.inbox_sync.stop()
+
+    await dispose_engines()
+    await pool.close()
 
 
 app = FastAPI(
@@ -42,11 +67,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many logins at the moment, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+
 app.include_router(user.router)
 app.include_router(chatbot.router)
 app.include_router(oauth.router)
 app.include_router(email.router)
 app.include_router(task.router)
+app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Request, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from langgraph.types import Command
 
-from app.services.chatbot.graph import get_graph
+from app.services.chatbot.graph import GraphRegistry
+from app.services.chatbot.llm_scheduler import llm_priority
+from app.services.chatbot.streaming import stream_chat_events
 from app.schemas.app import User
 from app.dependencies import get_current_user
 
@@ -19,6 +21,22 @@ class ChatbotQuery(BaseModel):
     resume: Optional[bool] = False
 
 
+def get_graph_input(query: ChatbotQuery, current_user: User):
+    """
+    Returns the input of the graph for the user's message
+    """
+    # User is responding to a message from the chatbot
+    if query.resume == True:
+        return Command(resume={"data": query.message})
+
+    # User is beginning a conversation with the chatbot
+    # Initialise the state of the graph with the current user & the next user message
+    return {
+        "user_id": current_user.user_id,
+        "messages": [{"role": "user", "content": query.message}]
+    }
+
+
 @router.post("/chatbot/query")
 async def chatbot_query(
     request: Request, 
@@ -29,30 +47,47 @@ async def chatbot_query(
     Processes a user's message with the chatbot and returns the chatbot's reply.
     """
     
-    # Initialise the checkpointer and the chatbot state graph
-    checkpointer: AsyncPostgresSaver = request.app.state.checkpointer
-    graph = await get_graph(checkpointer=checkpointer)
-
-    config = {"configurable": {"thread_id": query.thread_id}}
+    # Reuse the chatbot state graph compiled on startup
+    registry: GraphRegistry = request.app.state.graph_registry
+    graph = registry.graph
 
-    # Initialise the state of the graph with the current user & the next user message
-    state_dict = {
-        "user": current_user,
-        "messages": [{"role": "user", "content": query.message}]
-    }
+    config = registry.get_config(query.thread_id, current_user)
 
-    # User is responding to a message from the chatbot
-    if query.resume == True:
+    # The chat goes first in the LLM queues
+    with llm_priority("interactive", current_user.user_id):
         response = await graph.ainvoke(
-            Command(resume={"data": query.message}), 
-            config
-        )
-    else:
-        # User is beginning a conversation with the chatbot
-        response = await graph.ainvoke(
-            state_dict,
+            get_graph_input(query, current_user),
             config
         )
 
     # Otherwise return bot’s latest message
-    return response["messages"][-1].content
\ No newline at end of file
+    return response["messages"][-1].content
+
+
+@router.post("/chatbot/query/stream")
+async def chatbot_query_stream(
+    request: Request,
+    query: ChatbotQuery,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Same as /chatbot/query, but streams the chatbot's reply as server-sent events
+    (node transitions, model tokens as they are generated, interrupts, then the final message).
+    """
+    registry: GraphRegistry = request.app.state.graph_registry
+
+    async def events():
+        # Set while the response is streamed, after the endpoint returned
+        with llm_priority("interactive", current_user.user_id):
+            async for event in stream_chat_events(
+                registry.graph,
+                get_graph_input(query, current_user),
+                registry.get_config(query.thread_id, current_user)
+            ):
+                yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
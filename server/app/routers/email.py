@@ -1,18 +1,20 @@
-from datetime import datetime
+import asyncio
 from fastapi import APIRouter
 from typing import Annotated
 
-from fastapi import Response, Depends, HTTPException, status, Request
+from fastapi import Response, Depends, HTTPException, status, Request, Query
 from sqlmodel import select
 from pydantic import BaseModel
 
 from app.config import get_settings
-from app.db.connection import SessionDep
+from app.db.connection import AsyncSessionDep
 from app.dependencies import get_current_user
 from app.schemas.app import User, BaseEmail, Email
-from app.services.email import gmail_create_draft, gmail_send_draft, gmail_read_inbox
+from app.services.email import gmail_create_draft, gmail_send_draft, gmail_read_inbox, gmail_read_message_body
 
-from app.services.chatbot.email import get_ai_summary, get_ai_draft, Summary, Draft
+from app.services.gmail_sync import sync_gmail_inbox
+from app.services.email_summaries import summarise_pending_emails
+from app.services.chatbot.email import aget_ai_summary, aget_ai_draft, Summary, Draft
 
 router = APIRouter(tags=["email"])
 
@@ -20,7 +22,7 @@ router = APIRouter(tags=["email"])
 @router.post("/emails/add_email")
 async def add_email(
     current_user: Annotated[User, Depends(get_current_user)],
-    session: SessionDep,
+    session: AsyncSessionDep,
     email: BaseEmail
 ) -> Email:
     """
@@ -29,17 +31,17 @@ async def add_email(
 
     new_email = Email(**email.model_dump(), user_id=current_user.user_id)
     session.add(new_email)
-    session.commit()
-    session.refresh(new_email)
+    await session.commit()
+    await session.refresh(new_email)
     return new_email
 
 @router.get("/emails")
-def get_emails(
+async def get_emails(
         current_user: Annotated[User, Depends(get_current_user)],
-        session: SessionDep
+        session: AsyncSessionDep
 ) -> list[Email]:
-    return session.exec(select(Email)
-                        .where(Email.user_id == current_user.user_id)).all()
+    return (await session.exec(select(Email)
+                        .where(Email.user_id == current_user.user_id))).all()
 
 @router.post("/emails/create_draft")
 def create_draft(
@@ -73,37 +75,68 @@ class Message(BaseModel):
     message: str
 
 @router.post("/emails/gen_ai_summary")
-def gen_ai_summary(
+async def gen_ai_summary(
     message: Message
 ) -> Summary:
-    return get_ai_summary(message.message)
+    return await aget_ai_summary(message.message)
+
+@router.post("/emails/summarise")
+async def summarise_emails(
+    current_user: Annotated[User, Depends(get_current_user)]
+) -> dict:
+    """
+    Summarises a batch (SUMMARY_BATCH_SIZE) of the user's emails lacking a summary, so that the request stays
+    short. Returns the count, the throughput, and whether emails are left to summarise (`pending`, call again).
+    """
+    return await summarise_pending_emails(current_user.user_id, max_batches=1)
 
 @router.post("/emails/gen_ai_draft")
-def gen_ai_draft(
+async def gen_ai_draft(
     message: Message
 ) -> Draft:
-    return get_ai_draft(message.message)
+    return await aget_ai_draft(message.message)
 
 @router.post("/emails/get_emails")
-def get_gmail_emails(
+async def get_gmail_emails(
     current_user: Annotated[User, Depends(get_current_user)],
-    session: SessionDep,
-    label_ids: list[str] = None,
-    query: str = "is:unread"
+    session: AsyncSessionDep,
+    request: Request,
+    wait: bool = False
 ) -> list[Email]:
-    emails = gmail_read_inbox(current_user, label_ids = label_ids, query = query)
-    result = []
-    for email in emails:
-        parsed = Email(
-            from_sender = email["headers"]["From"],
-            email_subject = email["headers"]["Subject"],
-            email_status="unread",
-            email_timestamp=datetime.strptime(email["headers"]["Date"], "%a, %d %b %Y %H:%M:%S %z"),
-            full_content=email["body"]["text"],
-            user_id=current_user.user_id
-        )
-        session.add(parsed)
-        session.commit()
-        session.refresh(parsed)
-        result.append(parsed.model_copy())
-    return result
\ No newline at end of file
+    """
+    Returns the synced Gmail emails, latest first.
+    The inbox is synced in the background, this asks for a sync as soon as possible; with `wait` (or if the
+    background sync is disabled), the sync runs in the request instead, before reading the emails.
+    """
+    # Only the users who connected Gmail are synced
+    if current_user.refresh_token is not None:
+        if wait or not request.app.state.inbox_sync.request_sync(current_user.user_id):
+            await sync_gmail_inbox(session, current_user)
+
+    return (await session.exec(select(Email)
+                        .where(Email.user_id == current_user.user_id, Email.gmail_message_id.is_not(None))
+                        .order_by(Email.email_timestamp.desc()))).all()
+
+@router.get("/emails/gmail")
+async def list_gmail_emails(
+    current_user: Annotated[User, Depends(get_current_user)],
+    label_ids: Annotated[list[str] | None, Query()] = None,
+    query: str = "is:unread",
+    max_msgs: int = 50
+) -> list[dict]:
+    """
+    Lists the Gmail messages with their headers and snippet only, load a body with /emails/gmail/{message_id}/body
+    """
+    return await asyncio.to_thread(
+        gmail_read_inbox, current_user, max_msgs=max_msgs, label_ids=label_ids, query=query, with_body=False
+    )
+
+@router.get("/emails/gmail/{message_id}/body")
+async def get_gmail_email_body(
+    current_user: Annotated[User, Depends(get_current_user)],
+    message_id: str
+) -> dict:
+    body = await asyncio.to_thread(gmail_read_message_body, current_user, message_id)
+    if body is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
+    return body
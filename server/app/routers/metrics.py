@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+
+from app.utils import metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+async def get_metrics() -> dict:
+    """
+    Retrieves the in-process metrics of this worker (cache hit rates, LLM calls saved, etc.)
+    """
+    return metrics.snapshot()
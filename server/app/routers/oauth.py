@@ -5,8 +5,8 @@ from typing import Annotated
 from urllib.parse import urlencode
 from datetime import timedelta
 
-from ..db.connection import SessionDep
-from ..services.users import find_one, add_one
+from ..db.connection import AsyncSessionDep
+from ..services.users import find_one, add_one, update_google_tokens
 from ..services.auth import signup_user, UserSignup, create_access_token
 
 from ..schemas.app import User
@@ -44,7 +44,7 @@ async def login():
     return RedirectResponse(url)
 
 @router.get("/callback")
-async def oauth_callback(session: SessionDep, code: str):
+async def oauth_callback(session: AsyncSessionDep, code: str):
     # Exchange code for tokens
     data = {
         "code": code,
@@ -66,14 +66,11 @@ async def oauth_callback(session: SessionDep, code: str):
     first_name = userinfo["given_name"]
     last_name = userinfo["family_name"]
 
-    user = find_one(session, email)
+    user = await find_one(session, email)
 
     if user is None:
-        user = signup_user(session, UserSignup(email=email, name=f"{first_name} {last_name}", password="abcdefg"))
-        user.access_token = access_token
-        user.refresh_token = refresh_token
-        session.add(user)
-        session.commit()
+        user = await signup_user(session, UserSignup(email=email, name=f"{first_name} {last_name}", password="abcdefg"))
+        await update_google_tokens(session, user, access_token, refresh_token)
 
     settings = get_settings()
     access_token_expires = timedelta(
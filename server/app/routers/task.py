@@ -4,7 +4,7 @@ from typing import Annotated
 from fastapi import Response, Depends, HTTPException, status, Request
 from uuid import UUID
 from app.config import get_settings
-from app.db.connection import SessionDep
+from app.db.connection import AsyncSessionDep
 from app.dependencies import get_current_user
 from app.schemas.app import User, Task
 
@@ -14,9 +14,9 @@ router = APIRouter(tags=["task"])
 
 
 @router.post("/task")
-def add_task(
+async def add_task(
     current_user: Annotated[User, Depends(get_current_user)],
-    session: SessionDep,
+    session: AsyncSessionDep,
     title: str,
     description: str,
     email_id: UUID
@@ -27,13 +27,13 @@ def add_task(
 
     new_task = Task(title=title, task_description=description, email_id=email_id)
     session.add(new_task)
-    session.commit()
-    session.refresh(new_task)
+    await session.commit()
+    await session.refresh(new_task)
     return new_task
 
 @router.get("/task")
-def get_tasks(
+async def get_tasks(
     current_user: Annotated[User, Depends(get_current_user)],
-    session: SessionDep
+    session: AsyncSessionDep
 ) -> list[Task]:
-    return get_tasks_by_user(current_user, session)
\ No newline at end of file
+    return await get_tasks_by_user(current_user, session)
\ No newline at end of file
@@ -6,7 +6,7 @@ from fastapi import Response, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app.config import get_settings
-from app.db.connection import SessionDep
+from app.db.connection import AsyncSessionDep
 from app.dependencies import get_current_user
 from app.schemas.app import User
 from app.models.api import UserResponse
@@ -26,12 +26,12 @@ router = APIRouter(tags=["users"])
 @router.post("/token")
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    session: SessionDep,
+    session: AsyncSessionDep,
 ) -> Token:
     """
     Retrieves the access token given login details in *form_data*
     """
-    user = authenticate_user(
+    user = await authenticate_user(
         session, email=form_data.username, password=form_data.password
     )
     if not user:
@@ -52,8 +52,8 @@ async def login_for_access_token(
 
 
 @router.post("/users/login")
-async def user_login(user: UserLogin, session: SessionDep, response: Response):
-    user = authenticate_user(session, email=user.email, password=user.password)
+async def user_login(user: UserLogin, session: AsyncSessionDep, response: Response):
+    user = await authenticate_user(session, email=user.email, password=user.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -87,15 +87,15 @@ async def user_logout(response: Response):
 
 
 @router.post("/users/signup")
-def signup(signup: UserSignup, session: SessionDep, response: Response):
+async def signup(signup: UserSignup, session: AsyncSessionDep, response: Response):
     """
     Create a new user given details in *signup*
     """
-    if users.find_one(session, signup.email) is not None:
+    if await users.find_one(session, signup.email) is not None:
         response.status_code = status.HTTP_409_CONFLICT
         return {"message": "Username already taken"}
 
-    signup_user(session, signup)
+    await signup_user(session, signup)
 
     return {"message": "success"}
 
@@ -57,10 +57,39 @@ class Email(BaseEmail, table=True):
     __tablename__ = "email"
     email_id: UUID = Field(default_factory=uuid4, primary_key=True)
     user_id: UUID = Field(foreign_key="app_user.user_id")
+    gmail_message_id: Optional[str] = None
+    gmail_thread_id: Optional[str] = None
+    content_hash: Optional[str] = None  # of the normalised full_content, see services/email_summaries.py
 
     user: Optional[User] = Relationship(back_populates="emails")
     tasks: list["Task"] = Relationship(back_populates="email")
 
+class EmailSummary(SQLModel, table=True):
+    __tablename__ = "email_summary"
+
+    content_hash: str = Field(primary_key=True)
+    summary: str
+    created_at: datetime = Field(default_factory=datetime.now)
+
+class LLMCacheEntry(SQLModel, table=True):
+    __tablename__ = "llm_cache"
+
+    cache_key: str = Field(primary_key=True)
+    template: str
+    llm_hash: str
+    response: str
+    tokens: int
+    embedding: Any = Field(default=None, sa_type=Vector(1024))
+    created_at: datetime = Field(default_factory=datetime.now)
+    expires_at: datetime
+
+class GmailSync(SQLModel, table=True):
+    __tablename__ = "gmail_sync"
+
+    user_id: UUID = Field(foreign_key="app_user.user_id", primary_key=True)
+    history_id: int
+    synced_at: datetime
+
 class Task(SQLModel, table=True):
     __tablename__ = "task"
 
@@ -1,12 +1,12 @@
 import jwt
 from datetime import datetime, timedelta, timezone
-from passlib.context import CryptContext
 from pydantic import BaseModel
 from sqlmodel import select
 
 from app.config import get_settings
-from app.db.connection import SessionDep
+from app.db.connection import AsyncSessionDep
 from app.schemas.app import User, UserDetails
+import app.services.password_hashing as password_hashing
 import app.services.users as users
 
 
@@ -24,51 +24,45 @@ class UserLogin(BaseModel):
     password: str
 
 
-pwd_context = CryptContext()
-pwd_context.load_path("app/policy.ini")
-
-
-def verify_password(plain: str, hashed: str):
+async def get_password_hash(password: str) -> str:
     """
-    Verify the plain_password matches the hashed_password after hashed
+    Hash the password following the argon2 scheme, off the event loop
     """
-    return pwd_context.verify(plain, hashed, scheme="argon2")
+    return await password_hashing.hash_password(password)
 
 
-def get_password_hash(password: str):
-    """
-    Hash the password following bcrypt schemes
-    """
-    return pwd_context.hash(password, scheme="argon2")
-
-
-def signup_user(session: SessionDep, signup: UserSignup) -> User:
+async def signup_user(session: AsyncSessionDep, signup: UserSignup) -> User:
     """
     Add a new user into the database
     """
     user = User(
-        saltpassword=get_password_hash(signup.password),
+        saltpassword=await get_password_hash(signup.password),
         email=signup.email,
         name=signup.name,
     )
 
-    users.add_one(session, user)
+    await users.add_one(session, user)
     return user
 
 
-def authenticate_user(
-    session: SessionDep, email: str, password: str
+async def authenticate_user(
+    session: AsyncSessionDep, email: str, password: str
 ) -> User | None:
     """
     Finds the user given the email and password. Returns None if invalid credentials
     """
-    user = users.find_one(session, email)
+    user = await users.find_one(session, email)
     if user is None:
         return None
 
-    if not verify_password(plain=password, hashed=user.saltpassword):
+    verified, new_hash = await password_hashing.verify_password(plain=password, hashed=user.saltpassword)
+    if not verified:
         return None
 
+    # Transparently rehash the legacy (pbkdf2_sha256) hashes with argon2
+    if new_hash is not None:
+        await users.update_password_hash(session, user, new_hash)
+
     return user
 
 
@@ -1,9 +1,16 @@
 import os
 from functools import cache
 
-from langchain.chat_models import init_chat_model
+from langchain_core.runnables import RunnableConfig
+
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.config import get_settings
+from app.db.connection import get_async_engine
+from app.schemas.app import User
+from app.services.chatbot.llm_cache import get_llm_cache
+from app.services.chatbot.llm_router import RoutedChatMistralAI
+import app.services.users as users
 
 
 @cache
@@ -11,5 +18,29 @@ def get_chatbot():
     # Initialise chat model with Mistral AI
     os.environ["MISTRAL_API_KEY"] = get_settings().mistral_api_key
 
-    # Initialise LLM
-    return init_chat_model("mistral-small-latest", model_provider="mistralai")
+    # Initialise LLM, with the response cache of the opted in prompt templates,
+    # its calls routed by task class (see llm_router.py) and scheduled by priority and user (see llm_scheduler.py)
+    cache = {"cache": get_llm_cache()} if get_settings().llm_cache_enabled else {}
+    return RoutedChatMistralAI(model="mistral-small-latest", **cache)
+
+
+def get_model(config: RunnableConfig):
+    """
+    Returns the chat model supplied through the runnable config of a graph run.
+    Falls back to the process-wide chatbot if none was supplied.
+    """
+    model = config.get("configurable", {}).get("model") if config else None
+    return model if model is not None else get_chatbot()
+
+
+async def get_user(state: dict, config: RunnableConfig) -> User:
+    """
+    Returns the user of the conversation.
+    The graph state only holds the user_id, the user is resolved from the request (runnable config)
+    and only looked up in the database if the request did not provide it.
+    """
+    user = config.get("configurable", {}).get("user") if config else None
+    if user is not None and user.user_id == state.get("user_id"):
+        return user
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        return await users.find_by_id(session, state.get("user_id"))
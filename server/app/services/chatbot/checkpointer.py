@@ -1,23 +1,14 @@
-from functools import cache
 from contextlib import asynccontextmanager
 
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import AsyncConnectionPool
 
-from app.config import get_settings
 
-@cache
-def get_db_uri() -> str:
+@asynccontextmanager
+async def initialise_checkpointer(pool: AsyncConnectionPool):
     """
-    Returns the PostgreSQL connection string for LangGraph async checkpointer
+    Initialise the LangGraph async checkpointer on the shared connection pool
     """
-    settings = get_settings()
-    return (
-        f"postgresql://{settings.postgres_user}:{settings.postgres_password}@{settings.postgres_host}:5432/{settings.postgres_db}?sslmode=disable"
-    )
-
-@asynccontextmanager
-async def initialise_checkpointer():
-    db_uri = get_db_uri()
-    async with AsyncPostgresSaver.from_conn_string(db_uri) as checkpointer:
-        await checkpointer.setup()
-        yield checkpointer
+    checkpointer = AsyncPostgresSaver(conn=pool)
+    await checkpointer.setup()
+    yield checkpointer
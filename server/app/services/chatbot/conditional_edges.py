@@ -2,16 +2,20 @@ from app.services.chatbot.models import State
 
 def routing_determine_user_intent(state: State) -> str:
     """
-    Decide the next node based on the user intent
+    Decide the next node based on the user intent.
+    If the details were extracted together with the intent, skip the check_provided_* nodes
+    and go straight to asking for the missing details (or to the action if none are missing).
     """
     intent = state.get("intent")
 
+    extracted = state.get("intent_details_extracted")
+
     if intent == "generateInvoice":
-        return "check_provided_invoice_details"
+        return routing_check_provided_invoice_details(state) if extracted else "check_provided_invoice_details"
     elif intent == "sendEmail":
-        return "check_provided_email_details"
+        return routing_check_provided_email_details(state) if extracted else "check_provided_email_details"
     elif intent == "scheduleMeeting":
-        return "check_provided_meeting_details"
+        return routing_check_provided_meeting_details(state) if extracted else "check_provided_meeting_details"
     else:
         return "prompt_for_correct_user_intent"
     
@@ -80,6 +84,8 @@ def routing_wait_for_user_input(state: State) -> str:
         return "check_provided_invoice_details"
     elif state.get("intent") == "scheduleMeeting":
         return "check_provided_meeting_details"
+    elif state.get("intent") == "sendEmail" and state.get("email_address") is None:
+        return "check_provided_email_details"
     elif state.get("intent") == "sendEmail":
         return "determine_email_satisfaction"
     
\ No newline at end of file
@@ -1,4 +1,7 @@
 from app.services.chatbot.chatbot import get_chatbot
+from app.services.chatbot.helper_functions import ainvoke_structured, get_structured_llm
+from app.services.chatbot.llm_cache import cache_template
+from app.services.chatbot.llm_router import llm_task
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel
 
@@ -19,14 +22,22 @@ summary_prompt_template = ChatPromptTemplate.from_messages(
 class Summary(BaseModel):
   summary: str
 
+@llm_task("summarisation")
+@cache_template("email_summary")
 def get_ai_summary(message: str):
   model = get_chatbot()
   prompt = summary_prompt_template.invoke({"text": message})
   # Structured output
-  structured_llm = model.with_structured_output(schema=Summary)
-  result = structured_llm.invoke(prompt)
+  result = get_structured_llm(model, Summary).invoke(prompt)
   return result
 
+@llm_task("summarisation")
+@cache_template("email_summary")
+async def aget_ai_summary(message: str) -> Summary:
+  model = get_chatbot()
+  prompt = await summary_prompt_template.ainvoke({"text": message})
+  return await ainvoke_structured(model, Summary, prompt)
+
 # Prompt template for draft
 draft_prompt_template = ChatPromptTemplate.from_messages(
     [
@@ -51,10 +62,18 @@ class Draft(BaseModel):
   draft_subject: str
   draft_body: str
 
+@llm_task("generation")
+@cache_template("email_draft")
 def get_ai_draft(message: str) -> Draft:
   model = get_chatbot()
   prompt = draft_prompt_template.invoke({"text": message})
   # Structured output
-  structured_llm = model.with_structured_output(schema=Draft)
-  result = structured_llm.invoke(prompt)
-  return result
\ No newline at end of file
+  result = get_structured_llm(model, Draft).invoke(prompt)
+  return result
+
+@llm_task("generation")
+@cache_template("email_draft")
+async def aget_ai_draft(message: str) -> Draft:
+  model = get_chatbot()
+  prompt = await draft_prompt_template.ainvoke({"text": message})
+  return await ainvoke_structured(model, Draft, prompt)
@@ -1,13 +1,21 @@
-from functools import partial
+import asyncio
+import json
+import sys
+import time
+from uuid import uuid4
 
 from langgraph.graph import StateGraph, START, END
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 
+from app.config import get_settings
+from app.schemas.app import User
 from app.services.chatbot.chatbot import get_chatbot
 from app.services.chatbot.nodes import (
     determine_user_intent_node,
     prompt_for_correct_user_intent_node,
     wait_for_user_input_node,
+    summarise_conversation_node,
     check_provided_invoice_details_node,
     ask_for_invoice_details_node,
     generate_invoice_node,
@@ -32,38 +40,40 @@ from app.services.chatbot.conditional_edges import (
 from app.services.chatbot.models import State
 
 
-async def get_graph(checkpointer: AsyncPostgresSaver = None) -> StateGraph:
+def build_graph(checkpointer: AsyncPostgresSaver = None, debug: bool = False) -> CompiledStateGraph:
     """
-    Create the langgraph graph for a session
+    Build and compile the langgraph graph.
+    The nodes are model agnostic, the model is supplied through the runnable config at invoke time.
     """
-    model = get_chatbot()
-
     # Build the graph
     graph_builder = StateGraph(State)
 
     # Add nodes to the graph
-    graph_builder.add_node("determine_user_intent", partial(determine_user_intent_node, model))
-    graph_builder.add_node("prompt_for_correct_user_intent", partial(prompt_for_correct_user_intent_node, model))
-    graph_builder.add_node("wait_for_user_input", partial(wait_for_user_input_node, model))
-    graph_builder.add_node("check_provided_invoice_details", partial(check_provided_invoice_details_node, model))
-    graph_builder.add_node("ask_for_invoice_details", partial(ask_for_invoice_details_node, model))
-    graph_builder.add_node("generate_invoice", partial(generate_invoice_node, model))
-    graph_builder.add_node("check_provided_meeting_details", partial(check_provided_meeting_details_node, model))
-    graph_builder.add_node("ask_for_meeting_details", partial(ask_for_meeting_details_node, model))
-    graph_builder.add_node("schedule_meeting", partial(schedule_meeting_node, model))
-    graph_builder.add_node("generate_email", partial(generate_email_node, model))
-    graph_builder.add_node("determine_email_satisfaction", partial(determine_email_satisfaction_node, model))
-    graph_builder.add_node("send_email", partial(send_email_node, model))
-    graph_builder.add_node("check_provided_email_details", partial(check_provided_email_details_node, model))
-    graph_builder.add_node("ask_for_email_details", partial(ask_for_email_details_node, model))
+    graph_builder.add_node("determine_user_intent", determine_user_intent_node)
+    graph_builder.add_node("prompt_for_correct_user_intent", prompt_for_correct_user_intent_node)
+    graph_builder.add_node("wait_for_user_input", wait_for_user_input_node)
+    graph_builder.add_node("summarise_conversation", summarise_conversation_node)
+    graph_builder.add_node("check_provided_invoice_details", check_provided_invoice_details_node)
+    graph_builder.add_node("ask_for_invoice_details", ask_for_invoice_details_node)
+    graph_builder.add_node("generate_invoice", generate_invoice_node)
+    graph_builder.add_node("check_provided_meeting_details", check_provided_meeting_details_node)
+    graph_builder.add_node("ask_for_meeting_details", ask_for_meeting_details_node)
+    graph_builder.add_node("schedule_meeting", schedule_meeting_node)
+    graph_builder.add_node("generate_email", generate_email_node)
+    graph_builder.add_node("determine_email_satisfaction", determine_email_satisfaction_node)
+    graph_builder.add_node("send_email", send_email_node)
+    graph_builder.add_node("check_provided_email_details", check_provided_email_details_node)
+    graph_builder.add_node("ask_for_email_details", ask_for_email_details_node)
 
     # Add edges to the graph
     graph_builder.add_edge(START, "determine_user_intent")
-    graph_builder.add_edge("prompt_for_correct_user_intent", "wait_for_user_input")
-    graph_builder.add_edge("ask_for_invoice_details", "wait_for_user_input")
-    graph_builder.add_edge("ask_for_meeting_details", "wait_for_user_input")
-    graph_builder.add_edge("ask_for_email_details", "wait_for_user_input")
-    graph_builder.add_edge("generate_email", "wait_for_user_input")
+    # Compact the conversation at the end of each turn, before waiting for the user
+    graph_builder.add_edge("prompt_for_correct_user_intent", "summarise_conversation")
+    graph_builder.add_edge("ask_for_invoice_details", "summarise_conversation")
+    graph_builder.add_edge("ask_for_meeting_details", "summarise_conversation")
+    graph_builder.add_edge("ask_for_email_details", "summarise_conversation")
+    graph_builder.add_edge("generate_email", "summarise_conversation")
+    graph_builder.add_edge("summarise_conversation", "wait_for_user_input")
     graph_builder.add_edge("check_provided_email_details", "generate_email")
     graph_builder.add_edge("generate_invoice", END)
     graph_builder.add_edge("schedule_meeting", END)
@@ -77,4 +87,70 @@ async def get_graph(checkpointer: AsyncPostgresSaver = None) -> StateGraph:
     graph_builder.add_conditional_edges("determine_email_satisfaction", routing_determine_email_satisfaction)
     graph_builder.add_conditional_edges("wait_for_user_input", routing_wait_for_user_input)
 
-    return graph_builder.compile(checkpointer=checkpointer, debug=True)
+    return graph_builder.compile(checkpointer=checkpointer, debug=debug)
+
+
+class GraphRegistry:
+    """
+    Holds the compiled chatbot graph for the lifetime of the process, so it is only built once
+    instead of on every chat turn. Created in the app lifespan and stored in app.state.
+    """
+
+    def __init__(self, checkpointer: AsyncPostgresSaver = None, model=None):
+        self.checkpointer = checkpointer
+        self.model = model if model is not None else get_chatbot()
+        self.graph = build_graph(checkpointer=checkpointer, debug=get_settings().chatbot_graph_debug)
+
+    def get_config(self, thread_id: str, user: User = None) -> dict:
+        """
+        Returns the runnable config for a chat turn on the given thread, by the given user
+        """
+        return {"configurable": {"thread_id": thread_id, "model": self.model, "user": user}}
+
+
+async def benchmark(turns: int) -> dict:
+    """
+    Average overhead of a chat turn, compiling the graph for each turn vs reusing the registry's.
+    The model answers at once and the checkpoints are kept in memory, so only the graph's own work is measured:
+
+        python -m app.services.chatbot.graph benchmark [<turns>]
+    """
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    class CannedModel:
+        async def ainvoke(self, prompt, config=None):
+            return AIMessage(content="I can help with invoices, emails and meetings.")
+
+        def with_structured_output(self, schema):
+            return RunnableLambda(lambda prompt: schema.model_construct(**dict.fromkeys(schema.model_fields)))
+
+    checkpointer = InMemorySaver()
+    registry = GraphRegistry(checkpointer, model=CannedModel())
+
+    async def turn(graph: CompiledStateGraph, thread_id: str) -> None:
+        # Stops at the interrupt waiting for the user's reply
+        await graph.ainvoke(
+            {"user_id": uuid4(), "messages": [{"role": "user", "content": "hello"}]},
+            registry.get_config(thread_id)
+        )
+
+    await turn(registry.graph, "warmup")
+    results = {}
+    for name in ("compile_per_turn", "registry"):
+        start = time.perf_counter()
+        for i in range(turns):
+            graph = build_graph(checkpointer) if name == "compile_per_turn" else registry.graph
+            await turn(graph, f"{name}-{i}")
+        results[name] = {"ms_per_turn": (time.perf_counter() - start) * 1000 / turns}
+
+    return {"turns": turns, **results}
+
+
+if __name__ == "__main__":
+    command, *args = sys.argv[1:]
+    if command == "benchmark":
+        print(json.dumps(asyncio.run(benchmark(int(args[0]) if args else 100)), indent=2))
+    else:
+        raise SystemExit(f"Unknown command: {command}")
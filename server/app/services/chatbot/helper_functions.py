@@ -1,12 +1,34 @@
+import hashlib
+
+from langchain_core.prompt_values import PromptValue
 from langchain_core.prompts import ChatPromptTemplate
 from langgraph.types import interrupt
 
+from app.utils import metrics
+from app.utils.single_flight import SingleFlight
+from app.services.chatbot.llm_cache import cache_template
+from app.services.chatbot.llm_router import llm_task
+
 from app.services.chatbot.models import (
     UserIntent,
     InvoiceInfo,
     MeetingInfo,
     EmailInfo,
-    EmailSatisfaction
+    EmailSatisfaction,
+    UserIntentWithDetails
+)
+
+
+# Prompt template for the rolling summary of the conversation
+conversation_summary_prompt_template = ChatPromptTemplate.from_messages(
+    [
+        ("system",
+            "You are an expert at summarizing a conversation between a user and an assistant. "
+            "Merge the previous summary (if any) and the new messages into a short summary. "
+            "Keep every detail the user provided (names, email addresses, phone numbers, addresses, "
+            "items, costs, dates and times) and what the user asked for. Only output the summary."),
+        ("human", "Previous summary:\n{summary}\n\nNew messages:\n{text}"),
+    ]
 )
 
 
@@ -26,6 +48,28 @@ intent_prompt_template = ChatPromptTemplate.from_messages(
 )
 
 
+# Prompt template for classifying the intent and extracting its details in a single call
+intent_with_details_prompt_template = ChatPromptTemplate.from_messages(
+    [
+        ("system",
+            "You are an expert at classifying a user's intent when they provide instructions, "
+            "and at extracting the details they already gave for it. "
+            "Classify the intent strictly as one of the following: "
+            "'generateInvoice' if the user wants to create or generate an invoice. "
+            "'sendEmail' if the user wants to draft or send an email. "
+            "'scheduleMeeting' if the user wants to arrange, book, or plan a meeting. "
+            "Return null if the user's intent does not match any of these categories. "
+            "Then fill only the details object matching the intent, with the fields that are mentioned: "
+            "- invoice: name, phone_number, address, item_name and item_cost of the invoice "
+            "- meeting: meeting_title, recipient_email and start_time in ISO 8601 datetime format (e.g., 2025-09-29T15:30:00). "
+            "If the year is not specified, assume 2025. If the month is not specified, assume September (09). "
+            "- email: email_address of the email recipient "
+            "Leave any field that is not mentioned as null, do not make things up."),
+        ("human", "{text}"),
+    ]
+)
+
+
 # Prompt template for extracting invoice information from the user's message
 invoice_extraction_prompt_template = ChatPromptTemplate.from_messages(
     [
@@ -90,33 +134,52 @@ email_satisfaction_prompt_template = ChatPromptTemplate.from_messages(
 )
 
 
-def extract_user_intent(model, user_message: str) -> str:
+# Structured output runnables, bound once per (model, schema) instead of on every call
+_structured_llms: dict = {}
+
+
+def get_structured_llm(model, schema):
     """
-    Uses the structured LLM to classify the user's intent from the user's message.
-    Returns 'searchService', 'addService', or None.
+    Returns the model bound to the structured output `schema`, building it on first use only.
     """
-    # Build prompt
-    prompt = intent_prompt_template.invoke({"text": user_message})
+    key = (id(model), schema)
+    cached = _structured_llms.get(key)
+    if cached is None or cached[0] is not model:
+        cached = (model, model.with_structured_output(schema=schema))
+        _structured_llms[key] = cached
+    return cached[1]
 
-    # Structured output
-    structured_llm = model.with_structured_output(schema=UserIntent)
-    result = structured_llm.invoke(prompt)
 
-    return result.intent
+# Identical structured LLM calls in flight (eg: a double click, several tabs), made once
+_llm_calls = SingleFlight(name="llm_single_flight")
 
 
-def extract_invoice_info(model, user_message: str) -> dict:
+async def ainvoke_structured(model, schema, prompt: PromptValue):
     """
-    Uses the structured LLM to extract name, phone number, address, item name and item cost from the user's message.
-    Returns dict with optional 'name', 'phone number', 'address', 'item name' and 'item cost' fields
+    Invokes the model bound to the structured output `schema` on `prompt`, sharing the call with the identical
+    ones in flight. They are identified by model, schema and hash of the rendered prompt (so of its template
+    and input).
     """
-    # Build prompt
-    prompt = invoice_extraction_prompt_template.invoke({"text": user_message})
-    
-    # Structured output
-    structured_llm = model.with_structured_output(schema=InvoiceInfo)
-    result = structured_llm.invoke(prompt)
+    key = (id(model), schema, hashlib.sha256(prompt.to_string().encode()).hexdigest())
+    return await _llm_calls.run(key, lambda: get_structured_llm(model, schema).ainvoke(prompt))
+
+
+def _to_user_intent(result: UserIntent) -> str:
+    return result.intent
+
+
+def _to_user_intent_with_details(result: UserIntentWithDetails) -> dict:
+    details = {"intent": result.intent}
+    if result.intent == "generateInvoice" and result.invoice is not None:
+        details.update(_to_invoice_info(result.invoice))
+    elif result.intent == "scheduleMeeting" and result.meeting is not None:
+        details.update(_to_meeting_info(result.meeting))
+    elif result.intent == "sendEmail" and result.email is not None:
+        details.update(_to_email_info(result.email))
+    return details
+
 
+def _to_invoice_info(result: InvoiceInfo) -> dict:
     return {
         "name": result.name,
         "phone_number": result.phone_number,
@@ -126,55 +189,181 @@ def extract_invoice_info(model, user_message: str) -> dict:
     }
 
 
+def _to_meeting_info(result: MeetingInfo) -> dict:
+    return {
+        "meeting_title": result.meeting_title,
+        "recipient_email": result.recipient_email,
+        "start_time": result.start_time
+    }
+
+
+def _to_email_info(result: EmailInfo) -> dict:
+    return {
+        "email_address": result.email_address
+    }
+
+
+def _to_email_satisfaction(result: EmailSatisfaction) -> str:
+    return result.satisfied
+
+
+@llm_task("classification")
+@cache_template("intent")
+def extract_user_intent(model, user_message: str) -> str:
+    """
+    Uses the structured LLM to classify the user's intent from the user's message.
+    Returns 'generateInvoice', 'sendEmail', 'scheduleMeeting' or None.
+    """
+    prompt = intent_prompt_template.invoke({"text": user_message})
+    result = get_structured_llm(model, UserIntent).invoke(prompt)
+    return _to_user_intent(result)
+
+
+@llm_task("classification")
+@cache_template("intent")
+async def aextract_user_intent(model, user_message: str) -> str:
+    """
+    Async version of extract_user_intent, does not block the event loop.
+    """
+    prompt = await intent_prompt_template.ainvoke({"text": user_message})
+    result = await ainvoke_structured(model, UserIntent, prompt)
+    return _to_user_intent(result)
+
+
+@llm_task("extraction")
+@cache_template("intent_with_details")
+async def aextract_user_intent_with_details(model, user_message: str) -> dict:
+    """
+    Uses the structured LLM to classify the user's intent and extract the details for that intent
+    in a single call, saving the second round trip of the matching extract_*_info.
+    Returns dict with 'intent' and the optional detail fields of that intent.
+    """
+    prompt = await intent_with_details_prompt_template.ainvoke({"text": user_message})
+    result = await ainvoke_structured(model, UserIntentWithDetails, prompt)
+    return _to_user_intent_with_details(result)
+
+
+@llm_task("extraction")
+@cache_template("invoice_extraction")
+def extract_invoice_info(model, user_message: str) -> dict:
+    """
+    Uses the structured LLM to extract name, phone number, address, item name and item cost from the user's message.
+    Returns dict with optional 'name', 'phone number', 'address', 'item name' and 'item cost' fields
+    """
+    prompt = invoice_extraction_prompt_template.invoke({"text": user_message})
+    result = get_structured_llm(model, InvoiceInfo).invoke(prompt)
+    return _to_invoice_info(result)
+
+
+@llm_task("extraction")
+@cache_template("invoice_extraction")
+async def aextract_invoice_info(model, user_message: str) -> dict:
+    """
+    Async version of extract_invoice_info, does not block the event loop.
+    """
+    prompt = await invoice_extraction_prompt_template.ainvoke({"text": user_message})
+    result = await ainvoke_structured(model, InvoiceInfo, prompt)
+    return _to_invoice_info(result)
+
+
+@llm_task("extraction")
 def extract_meeting_info(model, user_message: str) -> dict:
     """
     Uses the structured LLM to extract meeting title, recipient email, and start time from the user's message.
     Returns a dictionary with optional 'meeting_title', 'recipient_email', and 'start_time' fields.
     """
-    # Build prompt
     prompt = meeting_extraction_prompt_template.invoke({"text": user_message})
-    
-    # Structured output
-    structured_llm = model.with_structured_output(schema=MeetingInfo)
-    result = structured_llm.invoke(prompt)
+    result = get_structured_llm(model, MeetingInfo).invoke(prompt)
+    return _to_meeting_info(result)
 
-    return {
-        "meeting_title": result.meeting_title,
-        "recipient_email": result.recipient_email,
-        "start_time": result.start_time
-    }
 
+@llm_task("extraction")
+async def aextract_meeting_info(model, user_message: str) -> dict:
+    """
+    Async version of extract_meeting_info, does not block the event loop.
+    """
+    prompt = await meeting_extraction_prompt_template.ainvoke({"text": user_message})
+    result = await ainvoke_structured(model, MeetingInfo, prompt)
+    return _to_meeting_info(result)
 
+
+@llm_task("extraction")
+@cache_template("email_extraction")
 def extract_email_info(model, user_message: str) -> dict:
     """
-    Uses the structured LLM to extract name, phone number, address, item name and item cost from the user's message.
-    Returns dict with optional 'name', 'phone number', 'address', 'item name' and 'item cost' fields
+    Uses the structured LLM to extract the recipient email address from the user's message.
+    Returns dict with optional 'email_address' field
     """
-    # Build prompt
     prompt = email_extraction_prompt_template.invoke({"text": user_message})
-    
-    # Structured output
-    structured_llm = model.with_structured_output(schema=EmailInfo)
-    result = structured_llm.invoke(prompt)
+    result = get_structured_llm(model, EmailInfo).invoke(prompt)
+    return _to_email_info(result)
 
-    return {
-        "email_address": result.email_address
-    }
+
+@llm_task("extraction")
+@cache_template("email_extraction")
+async def aextract_email_info(model, user_message: str) -> dict:
+    """
+    Async version of extract_email_info, does not block the event loop.
+    """
+    prompt = await email_extraction_prompt_template.ainvoke({"text": user_message})
+    result = await ainvoke_structured(model, EmailInfo, prompt)
+    return _to_email_info(result)
 
 
+@llm_task("classification")
+@cache_template("email_satisfaction")
 def extract_email_satisfaction(model, user_message: str) -> str:
     """
-    Uses the structured LLM to extract satisfaction about the gathered insertion details from the user's message.
-    Returns dict with optional 'satisfied' field
+    Uses the structured LLM to extract satisfaction about the generated email from the user's message.
+    Returns 'True' or 'False'
     """
-    # Build prompt
     prompt = email_satisfaction_prompt_template.invoke({"text": user_message})
-    
-    # Structured output
-    structured_llm = model.with_structured_output(schema=EmailSatisfaction)
-    result = structured_llm.invoke(prompt)
+    result = get_structured_llm(model, EmailSatisfaction).invoke(prompt)
+    return _to_email_satisfaction(result)
 
-    return result.satisfied
+
+@llm_task("classification")
+@cache_template("email_satisfaction")
+async def aextract_email_satisfaction(model, user_message: str) -> str:
+    """
+    Async version of extract_email_satisfaction, does not block the event loop.
+    """
+    prompt = await email_satisfaction_prompt_template.ainvoke({"text": user_message})
+    result = await ainvoke_structured(model, EmailSatisfaction, prompt)
+    return _to_email_satisfaction(result)
+
+
+metrics.register_rate("rule_extraction.llm_calls_saved_rate", "rule_extraction.llm_calls_saved", "rule_extraction.llm_calls")
+
+
+@llm_task("summarisation")
+async def asummarise_conversation(model, summary: str | None, messages: str) -> str:
+    """
+    Uses the LLM to fold the rendered `messages` into the previous conversation `summary`.
+    Returns the new summary.
+    """
+    prompt = await conversation_summary_prompt_template.ainvoke({"summary": summary or "None", "text": messages})
+    result = await model.ainvoke(prompt)
+    return result.content
+
+
+async def extract_details(model, state: dict, message: str, required_details: list[str], rule_extractor, llm_extractor) -> dict:
+    """
+    Extracts the details from the message with the rule based extractor first, and only calls the LLM
+    for the details it could not parse confidently and that are not already known.
+    """
+    extracted_info = rule_extractor(message)
+
+    if all(extracted_info.get(detail) is not None or state.get(detail) for detail in required_details):
+        metrics.increment("rule_extraction.llm_calls_saved")
+        return extracted_info
+
+    metrics.increment("rule_extraction.llm_calls")
+    llm_info = await llm_extractor(model, message)
+    return {
+        detail: extracted_info.get(detail) if extracted_info.get(detail) is not None else llm_info.get(detail)
+        for detail in required_details
+    }
 
 
 def user_input(query: str) -> str: 
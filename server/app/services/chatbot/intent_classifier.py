@@ -0,0 +1,243 @@
+"""
+Lightweight local intent classifier, used before the LLM for obvious messages (eg: "send an email to bob@x.com").
+
+Hashed word and character n-grams fed to a softmax linear model, in NumPy only (CPU, no extra dependency).
+The artifact is trained offline and loaded through the INTENT_CLASSIFIER_PATH setting:
+
+    python -m app.services.chatbot.intent_classifier train <model.npz> [<examples.jsonl>]
+    python -m app.services.chatbot.intent_classifier evaluate <model.npz> [<fixtures.jsonl>]
+
+Examples are jsonl lines of {"text": ..., "intent": ...}, with intent null when none applies.
+Training defaults to the seed examples in data/intent_examples.jsonl, and evaluation to the held-out
+fixtures in data/intent_fixtures.jsonl (never trained on).
+They can also be exported from the logged conversations with `export_examples_from_checkpointer`.
+"""
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from functools import cache
+
+import numpy as np
+
+from app.config import get_settings
+from app.utils import metrics
+
+
+# Label used for messages matching none of the UserIntent labels
+NO_INTENT = "none"
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "data")
+SEED_EXAMPLES_PATH = os.path.join(DATA_PATH, "intent_examples.jsonl")
+# Held-out labelled messages, to evaluate a classifier on messages it was not trained on
+FIXTURES_PATH = os.path.join(DATA_PATH, "intent_fixtures.jsonl")
+
+EMAIL_TOKEN_RE = re.compile(r"\S+@\S+\.\w+")
+NUMBER_TOKEN_RE = re.compile(r"[$€£]?\d[\d,.:/-]*")
+WORD_RE = re.compile(r"<?\w+>?")
+
+
+def _tokenise(text: str) -> list[str]:
+    text = text.lower()
+    text = EMAIL_TOKEN_RE.sub(" <email> ", text)
+    text = NUMBER_TOKEN_RE.sub(" <num> ", text)
+    return WORD_RE.findall(text)
+
+
+def _features(text: str, n_features: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the hashed feature indices and their L2 normalised weights (word 1-2 grams, char 3-grams)
+    """
+    words = _tokenise(text)
+    grams = [f"w:{word}" for word in words]
+    grams += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+
+    if not grams:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    # crc32 is stable across processes, unlike the builtin hash
+    hashed = np.array([zlib.crc32(gram.encode()) % n_features for gram in grams], dtype=np.int64)
+    indices, counts = np.unique(hashed, return_counts=True)
+    values = counts.astype(np.float32)
+    return indices, values / np.linalg.norm(values)
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    scores = scores - scores.max(axis=-1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class IntentClassifier:
+    """
+    Softmax linear model over hashed n-grams
+    """
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: list[str]):
+        self.weights = weights
+        self.bias = bias
+        self.labels = labels
+        self.n_features = weights.shape[0]
+
+    def predict(self, text: str) -> tuple[str | None, float]:
+        """
+        Returns the predicted intent (None for no intent) and its confidence
+        """
+        indices, values = _features(text, self.n_features)
+        probabilities = _softmax(values @ self.weights[indices] + self.bias)
+        best = int(probabilities.argmax())
+        label = self.labels[best]
+        return (None if label == NO_INTENT else label), float(probabilities[best])
+
+    @classmethod
+    def train(
+        cls,
+        examples: list[tuple[str, str | None]],
+        n_features: int = 2 ** 14,
+        epochs: int = 100,
+        learning_rate: float = 1.0,
+        l2: float = 1e-4,
+        batch_size: int = 256,
+        seed: int = 0
+    ) -> "IntentClassifier":
+        """
+        Trains the classifier with mini-batch gradient descent on (text, intent) examples
+        """
+        labels = sorted({intent or NO_INTENT for _, intent in examples})
+        label_index = {label: i for i, label in enumerate(labels)}
+        features = [_features(text, n_features) for text, _ in examples]
+        targets = np.array([label_index[intent or NO_INTENT] for _, intent in examples])
+
+        weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+        bias = np.zeros(len(labels), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+
+        for _ in range(epochs):
+            order = rng.permutation(len(examples))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                x = np.zeros((len(batch), n_features), dtype=np.float32)
+                for row, i in enumerate(batch):
+                    x[row, features[i][0]] = features[i][1]
+
+                # Gradient of the cross entropy loss
+                gradient = _softmax(x @ weights + bias)
+                gradient[np.arange(len(batch)), targets[batch]] -= 1
+                gradient /= len(batch)
+
+                weights -= learning_rate * (x.T @ gradient + l2 * weights)
+                bias -= learning_rate * gradient.sum(axis=0)
+
+        return cls(weights, bias, labels)
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        artifact = np.load(path)
+        return cls(artifact["weights"], artifact["bias"], [str(label) for label in artifact["labels"]])
+
+
+@cache
+def get_intent_classifier() -> IntentClassifier | None:
+    """
+    Returns the classifier loaded from INTENT_CLASSIFIER_PATH, None if it is not configured
+    """
+    path = get_settings().intent_classifier_path
+    return IntentClassifier.load(path) if path else None
+
+
+def classify_intent(message: str) -> tuple[bool, str | None]:
+    """
+    Classifies the intent locally.
+    Returns (True, intent) if confident enough, (False, None) if the LLM should decide instead.
+    """
+    classifier = get_intent_classifier()
+    if classifier is None:
+        return False, None
+
+    intent, confidence = classifier.predict(message)
+    if confidence < get_settings().intent_classifier_threshold:
+        metrics.increment("intent_classifier.deferred")
+        return False, None
+
+    metrics.increment("intent_classifier.hit")
+    return True, intent
+
+
+metrics.register_rate("intent_classifier.hit_rate", "intent_classifier.hit", "intent_classifier.deferred")
+
+
+def load_examples(path: str) -> list[tuple[str, str | None]]:
+    with open(path) as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+    return [(row["text"], row.get("intent")) for row in rows]
+
+
+async def export_examples_from_checkpointer(checkpointer) -> list[tuple[str, str | None]]:
+    """
+    Builds training examples from the logged conversations:
+    the first user message of each thread, labelled with the intent the thread ended up with.
+    """
+    examples = {}
+    async for checkpoint in checkpointer.alist(None):
+        thread_id = checkpoint.config["configurable"]["thread_id"]
+        values = checkpoint.checkpoint["channel_values"]
+        # alist returns the latest checkpoint of a thread first
+        if thread_id in examples or not values.get("messages"):
+            continue
+        first_message = next((m for m in values["messages"] if m.type == "human"), None)
+        if first_message is not None:
+            examples[thread_id] = (first_message.content, values.get("intent"))
+    return list(examples.values())
+
+
+def evaluate(classifier: IntentClassifier, examples: list[tuple[str, str | None]]) -> dict:
+    """
+    Returns the accuracy, the accuracy and coverage above the confidence threshold, and the latency
+    """
+    threshold = get_settings().intent_classifier_threshold
+    correct = confident = confident_correct = 0
+    latencies = []
+
+    for text, intent in examples:
+        start = time.perf_counter()
+        predicted, confidence = classifier.predict(text)
+        latencies.append(time.perf_counter() - start)
+
+        correct += predicted == intent
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += predicted == intent
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "examples": len(examples),
+        "accuracy": correct / len(examples),
+        "coverage": confident / len(examples),
+        "confident_accuracy": confident_correct / confident if confident else None,
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)),
+        "latency_ms_p99": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+if __name__ == "__main__":
+    command, *args = sys.argv[1:]
+    if command == "train":
+        model_path, *examples_paths = args
+        examples = [
+            example for path in examples_paths or [SEED_EXAMPLES_PATH]
+            for example in load_examples(path)
+        ]
+        IntentClassifier.train(examples).save(model_path)
+    elif command == "evaluate":
+        model_path, fixtures_path = args[0], args[1] if len(args) > 1 else FIXTURES_PATH
+        print(json.dumps(evaluate(IntentClassifier.load(model_path), load_examples(fixtures_path)), indent=2))
+    else:
+        raise SystemExit(f"Unknown command: {command}")
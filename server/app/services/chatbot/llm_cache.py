@@ -0,0 +1,264 @@
+"""
+Response cache of the chat model (see get_chatbot), for the prompt templates opted in.
+
+The LLM calls of a function decorated with `cache_template(name)` are cached if `name` is in
+LLM_CACHE_TEMPLATES. Prompts depending on anything else than their text (eg: the current time for the
+meeting details) must not opt in.
+
+- Exact tier: the responses by hash of the model parameters and the prompt, in an in-process LRU in front of
+  the llm_cache table, so the cache is shared by the workers and survives restarts.
+- Semantic tier, for the templates in LLM_CACHE_SEMANTIC_TEMPLATES: on an exact miss the prompt is embedded
+  (mistral-embed), and the response of the most similar cached prompt (same template and model parameters)
+  is reused if their cosine similarity is at least LLM_CACHE_SIMILARITY_THRESHOLD (pgvector).
+
+Entries expire after LLM_CACHE_TTL seconds, the LRU keeps LLM_CACHE_SIZE entries and the table
+LLM_CACHE_MAX_ROWS (oldest evicted first).
+"""
+import hashlib
+import json
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from functools import cache
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+from langchain_mistralai import MistralAIEmbeddings
+from sqlalchemy import delete, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import get_settings
+from app.db.connection import get_async_engine
+from app.schemas.app import LLMCacheEntry
+from app.utils import metrics
+from app.utils.cache import TTLCache
+from app.utils.context import context_decorator
+
+logger = logging.getLogger(__name__)
+
+# Updates between two purges of the expired and evicted rows
+PURGE_EVERY = 100
+
+_cache_template: ContextVar[Optional[str]] = ContextVar("llm_cache_template", default=None)
+
+
+def cache_template(name: str):
+    """
+    Decorator opting the LLM calls of the (sync or async) function in the response cache, as template `name`
+    """
+    return context_decorator(_cache_template, name)
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _count_tokens(generations: Sequence) -> int:
+    tokens = 0
+    for generation in generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        tokens += (usage or {}).get("total_tokens", 0)
+    return tokens
+
+
+def _prompt_text(prompt: str) -> str:
+    """
+    Text of the non system messages of a serialised prompt, the part that differs between prompts of a template
+    """
+    messages = json.loads(prompt)
+    return "\n".join(
+        str(message.get("kwargs", {}).get("content", "")) for message in messages
+        if message.get("id", [""])[-1] != "SystemMessage"
+    )
+
+
+@cache
+def get_embeddings() -> MistralAIEmbeddings:
+    return MistralAIEmbeddings(model="mistral-embed", api_key=get_settings().mistral_api_key)
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Exact and semantic response cache, see the module docstring. Sync lookups only use the in-process tier.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.templates = set(settings.llm_cache_templates)
+        self.semantic_templates = set(settings.llm_cache_semantic_templates)
+        self.similarity_threshold = settings.llm_cache_similarity_threshold
+        self.ttl = settings.llm_cache_ttl
+        self.max_rows = settings.llm_cache_max_rows
+        self._memory = TTLCache(settings.llm_cache_size, settings.llm_cache_ttl, name="llm_cache.memory")
+        # Embeddings computed on a semantic miss, stored with the response once generated
+        self._embeddings = TTLCache(settings.llm_cache_size, 300)
+        self._updates = 0
+
+    def _template(self) -> str | None:
+        template = _cache_template.get()
+        return template if template in self.templates else None
+
+    @staticmethod
+    def _record(template: str, tier: str | None, tokens: int = 0) -> None:
+        if tier is None:
+            metrics.increment("llm_cache.miss")
+            return
+        metrics.increment("llm_cache.hit")
+        metrics.increment(f"llm_cache.{tier}_hit")
+        metrics.increment(f"llm_cache.{template}.hit")
+        metrics.increment("llm_cache.saved_tokens", tokens)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        template = self._template()
+        if template is None:
+            return None
+
+        entry = self._memory.get(_hash(llm_string, prompt))
+        self._record(template, "memory" if entry else None, entry[1] if entry else 0)
+        return entry[0] if entry else None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self._template() is not None:
+            self._memory.set(_hash(llm_string, prompt), (return_val, _count_tokens(return_val)))
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        template = self._template()
+        if template is None:
+            return None
+
+        key = _hash(llm_string, prompt)
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._record(template, "memory", entry[1])
+            return entry[0]
+
+        now = datetime.now(timezone.utc)
+        # The cache must never fail an LLM call, the database tiers count as a miss if unavailable
+        try:
+            async with AsyncSession(get_async_engine()) as session:
+                row = (await session.exec(
+                    select(LLMCacheEntry.cache_key, LLMCacheEntry.response, LLMCacheEntry.tokens)
+                    .where(LLMCacheEntry.cache_key == key, LLMCacheEntry.expires_at > now)
+                )).first()
+            tier = "db"
+
+            if row is None and template in self.semantic_templates:
+                row = await self._semantic_lookup(key, template, _hash(llm_string), prompt, now)
+                tier = "semantic"
+        except Exception as error:
+            logger.warning(f"Could not look up the LLM cache: {error}")
+            row = None
+
+        if row is None:
+            self._record(template, None)
+            return None
+
+        cache_key, response, tokens = row
+        try:
+            generations = loads(response, allowed_objects="core")
+        except Exception as error:
+            # Eg: serialised by another version of langchain-core, dropped so that the next response replaces it
+            logger.warning(f"Could not read the cached LLM response, dropping it: {error}")
+            await self._delete(cache_key)
+            self._record(template, None)
+            return None
+
+        self._memory.set(key, (generations, tokens))
+        self._record(template, tier, tokens)
+        return generations
+
+    async def _delete(self, cache_key: str) -> None:
+        try:
+            async with AsyncSession(get_async_engine()) as session:
+                await session.exec(delete(LLMCacheEntry).where(LLMCacheEntry.cache_key == cache_key))
+                await session.commit()
+        except Exception as error:
+            logger.warning(f"Could not delete the LLM cache entry: {error}")
+
+    async def _semantic_lookup(self, key: str, template: str, llm_hash: str, prompt: str, now: datetime):
+        try:
+            embedding = await get_embeddings().aembed_query(_prompt_text(prompt))
+        except Exception as error:
+            logger.warning(f"Could not embed the prompt for the semantic cache: {error}")
+            return None
+        self._embeddings.set(key, embedding)
+
+        distance = LLMCacheEntry.embedding.cosine_distance(embedding)
+        async with AsyncSession(get_async_engine()) as session:
+            row = (await session.exec(
+                select(LLMCacheEntry.cache_key, LLMCacheEntry.response, LLMCacheEntry.tokens, distance)
+                .where(
+                    LLMCacheEntry.template == template,
+                    LLMCacheEntry.llm_hash == llm_hash,
+                    LLMCacheEntry.expires_at > now,
+                    LLMCacheEntry.embedding.is_not(None)
+                )
+                .order_by(distance)
+                .limit(1)
+            )).first()
+        if row is None or 1 - row[3] < self.similarity_threshold:
+            return None
+        return row[:3]
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        template = self._template()
+        if template is None:
+            return
+
+        key = _hash(llm_string, prompt)
+        tokens = _count_tokens(return_val)
+        self._memory.set(key, (return_val, tokens))
+
+        now = datetime.now(timezone.utc)
+        statement = insert(LLMCacheEntry).values(
+            cache_key=key,
+            template=template,
+            llm_hash=_hash(llm_string),
+            response=dumps(return_val),
+            tokens=tokens,
+            embedding=self._embeddings.get(key),
+            created_at=now,
+            expires_at=now + timedelta(seconds=self.ttl),
+        )
+        try:
+            async with AsyncSession(get_async_engine()) as session:
+                await session.exec(statement.on_conflict_do_update(
+                    index_elements=["cache_key"],
+                    set_={name: statement.excluded[name] for name in ("response", "tokens", "created_at", "expires_at")}
+                ))
+                self._updates += 1
+                if self._updates % PURGE_EVERY == 0:
+                    await self._purge(session, now)
+                await session.commit()
+        except Exception as error:
+            logger.warning(f"Could not store the LLM response in the cache: {error}")
+
+    async def _purge(self, session: AsyncSession, now: datetime) -> None:
+        """
+        Deletes the expired rows, and the oldest ones beyond LLM_CACHE_MAX_ROWS
+        """
+        await session.exec(delete(LLMCacheEntry).where(LLMCacheEntry.expires_at <= now))
+        await session.exec(text(
+            "DELETE FROM llm_cache WHERE cache_key IN "
+            "(SELECT cache_key FROM llm_cache ORDER BY created_at DESC OFFSET :max_rows)"
+        ).bindparams(max_rows=self.max_rows))
+
+    def clear(self, **kwargs: Any) -> None:
+        self._memory.clear()
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self._memory.clear()
+        async with AsyncSession(get_async_engine()) as session:
+            await session.exec(delete(LLMCacheEntry))
+            await session.commit()
+
+
+metrics.register_rate("llm_cache.hit_rate", "llm_cache.hit", "llm_cache.miss")
+
+
+@cache
+def get_llm_cache() -> LLMResponseCache:
+    return LLMResponseCache()
@@ -0,0 +1,161 @@
+"""
+Routing of the chat model calls to a model by task class, so that cheap calls run on the fastest model.
+
+A call site declares its task class with `llm_task` (classification, extraction, summarisation or
+generation). Its calls go to the models of the class in LLM_ROUTES, in order: the next model is tried if a
+call fails or exceeds the timeout of the class (counted once the call left the queue, see llm_scheduler.py).
+Calls without a task class use the model of get_chatbot, as before.
+
+Per route (task class and model), the latency is exported as the llm_router.latency.<task>.<model> histogram,
+and the calls, errors, fallbacks, tokens and cost (LLM_MODEL_PRICES) as llm_router.<task>.<model>.* counters.
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_mistralai import ChatMistralAI
+
+from app.config import LLMRoute, get_settings
+from app.services.chatbot.llm_scheduler import estimate_tokens, get_llm_scheduler
+from app.utils import metrics
+from app.utils.context import context_decorator
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("classification", "extraction", "summarisation", "generation")
+
+_llm_task: ContextVar[Optional[str]] = ContextVar("llm_task", default=None)
+
+
+def llm_task(task: str):
+    """
+    Decorator routing the LLM calls of the (sync or async) function to the models of the task class `task`
+    """
+    if task not in TASKS:
+        raise ValueError(f"Unknown LLM task class: {task}")
+    return context_decorator(_llm_task, task)
+
+
+def _record(task: str, model: str, started_at: float, input_tokens: int, output_tokens: int) -> None:
+    prefix = f"llm_router.{task}.{model}"
+    metrics.observe(f"llm_router.latency.{task}.{model}", time.monotonic() - started_at)
+    metrics.increment(f"{prefix}.calls")
+    metrics.increment(f"{prefix}.tokens", input_tokens + output_tokens)
+    input_price, output_price = get_settings().llm_model_prices.get(model, (0.0, 0.0))
+    metrics.increment(f"{prefix}.cost_usd", (input_tokens * input_price + output_tokens * output_price) / 1_000_000)
+
+
+async def _first_chunk_timeout(stream: AsyncIterator, timeout: float | None) -> AsyncIterator:
+    """
+    Fails the stream if its first chunk takes more than `timeout` seconds
+    """
+    iterator = aiter(stream)
+    try:
+        first = await asyncio.wait_for(anext(iterator), timeout)
+    except StopAsyncIteration:
+        return
+    yield first
+    async for chunk in iterator:
+        yield chunk
+
+
+class RoutedChatMistralAI(ChatMistralAI):
+    """
+    Mistral chat model routing its async calls by task class, each call scheduled by the LLM scheduler.
+    The sync calls are neither routed nor scheduled.
+    """
+
+    def _route(self) -> tuple[str, LLMRoute]:
+        task = _llm_task.get()
+        route = get_settings().llm_routes.get(task) if task is not None else None
+        if route is None:
+            return task or "default", LLMRoute(models=[self.model])
+        return task, route
+
+    def _get_llm_string(self, stop: Optional[list[str]] = None, **kwargs: Any) -> str:
+        # Responses are cached by the models actually called
+        return f"{super()._get_llm_string(stop, **kwargs)}---models:{','.join(self._route()[1].models)}"
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        stream: Optional[bool] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        parent = super()
+        if stream if stream is not None else self.streaming:
+            # Generated from _astream, routed there
+            return await parent._agenerate(messages, stop, run_manager, stream, **kwargs)
+
+        task, route = self._route()
+
+        async def call(model: str) -> ChatResult:
+            started_at = time.monotonic()
+            result = await asyncio.wait_for(
+                parent._agenerate(messages, stop, run_manager, stream, model=model, **kwargs), route.timeout
+            )
+            result.llm_output = {**(result.llm_output or {}), "model_name": model, "model": model}
+            usage = result.llm_output.get("token_usage") or {}
+            _record(task, model, started_at, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+            return result
+
+        for i, model in enumerate(route.models):
+            try:
+                return await get_llm_scheduler().run(lambda: call(model), estimate_tokens(messages))
+            except Exception as error:
+                self._on_error(task, route, i, error)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        parent = super()
+        task, route = self._route()
+
+        for i, model in enumerate(route.models):
+            started_at = time.monotonic()
+            usage = {}
+            streamed = False
+            try:
+                async for chunk in get_llm_scheduler().stream(
+                    lambda: _first_chunk_timeout(
+                        parent._astream(messages, stop, run_manager, model=model, **kwargs), route.timeout
+                    ),
+                    estimate_tokens(messages)
+                ):
+                    streamed = True
+                    usage = getattr(chunk.message, "usage_metadata", None) or usage
+                    yield chunk
+            except Exception as error:
+                # Only fall back if nothing was streamed yet
+                if streamed:
+                    metrics.increment(f"llm_router.{task}.{model}.errors")
+                    raise
+                self._on_error(task, route, i, error)
+                continue
+
+            _record(task, model, started_at, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+            return
+
+    @staticmethod
+    def _on_error(task: str, route: LLMRoute, i: int, error: Exception) -> None:
+        """
+        Records the failed call to the i-th model of the route, and raises if it was the last one
+        """
+        model = route.models[i]
+        metrics.increment(f"llm_router.{task}.{model}.errors")
+        if i == len(route.models) - 1:
+            raise error
+        reason = "timed out" if isinstance(error, TimeoutError) else f"failed: {error!r}"
+        logger.warning(f"LLM call of task {task} to {model} {reason}, falling back to {route.models[i + 1]}")
+        metrics.increment(f"llm_router.{task}.fallbacks")
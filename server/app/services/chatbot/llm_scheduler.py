@@ -0,0 +1,257 @@
+"""
+Scheduling of the chat model calls (see get_chatbot and llm_router.py), so that background work doesn't slow
+the chat down.
+
+A call waits in the queue of its priority class, set with `llm_priority`: interactive (the chat) before draft
+(the AI summaries and drafts asked for, and the calls without a class) before batch (the summarisation
+pipeline). Within a class the users are served by weighted fair queuing on the estimated tokens of their
+calls, so a user sending many or long prompts waits behind the others.
+
+The first call of the highest class starts once a slot is free (LLM_MAX_CONCURRENCY) and the requests and
+tokens per minute buckets allow it. A rate limited (429) call is retried ahead of the newer calls of its
+class, after a pause (Retry-After, or exponential) during which no call starts. The concurrency is also
+halved, and grows back by one every `concurrency` successful calls.
+
+Cache hits (see llm_cache.py) never wait. The queue waits are exported as the
+llm_scheduler.queue_wait.<priority> histograms.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache
+from typing import AsyncIterator, Awaitable, Callable, Hashable, Optional
+
+import httpx
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.config import get_settings
+from app.utils import metrics
+from app.utils.rate_limit import TokenBucket
+
+PRIORITIES = ("interactive", "draft", "batch")
+DEFAULT_PRIORITY = "draft"
+
+# Tokens of a response, estimated before the call along with the prompt's (corrected once done)
+RESPONSE_TOKENS_ESTIMATE = 256
+# Seconds of the pause after a first rate limited call, doubled for each consecutive one
+BASE_BACKOFF = 1.0
+# Users whose fair queuing state is kept before dropping the idle ones
+MAX_TRACKED_USERS = 1000
+
+_request: ContextVar[tuple[str, Hashable]] = ContextVar("llm_request", default=(DEFAULT_PRIORITY, None))
+
+
+@contextmanager
+def llm_priority(priority: str, user_id: Hashable = None):
+    """
+    Schedules the chat model calls made in the block with `priority`, on behalf of `user_id`
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    token = _request.set((priority, user_id))
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def estimate_tokens(messages: list[BaseMessage]) -> int:
+    return sum(len(str(message.content)) for message in messages) // 4 + RESPONSE_TOKENS_ESTIMATE
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429
+
+
+class LLMScheduler:
+    """
+    Priority, fair and rate limited admission of the chat model calls, see the module docstring
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.max_concurrency = settings.llm_max_concurrency
+        self.max_retries = settings.llm_max_retries
+        self.max_backoff = settings.llm_max_backoff
+
+        self._requests = TokenBucket(settings.llm_requests_per_minute / 60, capacity=settings.llm_requests_per_minute)
+        self._tokens = TokenBucket(settings.llm_tokens_per_minute / 60, capacity=settings.llm_tokens_per_minute)
+        self._limit = self.max_concurrency
+        self._in_flight = 0
+        self._successes = 0
+        self._rate_limited = 0  # consecutive rate limited calls
+        self._paused_until = 0.0
+
+        # Waiting calls by priority: heaps of (finish tag, sequence, tokens, future)
+        self._queues: dict[str, list] = {priority: [] for priority in PRIORITIES}
+        self._virtual_time = dict.fromkeys(PRIORITIES, 0.0)
+        self._finish_tags: dict[tuple[str, Hashable], float] = {}
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        metrics.register_gauge("llm_scheduler", self.stats)
+
+    def _finish_tag(self, priority: str, user_id: Hashable, tokens: int) -> float:
+        if len(self._finish_tags) > MAX_TRACKED_USERS:
+            # A user whose tag is behind the virtual time is served as a new one anyway
+            self._finish_tags = {
+                key: tag for key, tag in self._finish_tags.items() if tag > self._virtual_time[key[0]]
+            }
+        key = (priority, user_id)
+        tag = self._finish_tags[key] = max(self._virtual_time[priority], self._finish_tags.get(key, 0.0)) + tokens
+        return tag
+
+    async def _acquire(self, priority: str, tag: float, tokens: int) -> None:
+        """
+        Waits for the turn of the call, then takes a slot (to _release) and its requests and tokens
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority], (tag, next(self._sequence), tokens, future))
+        enqueued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelled just after being given the slot
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        metrics.observe(f"llm_scheduler.queue_wait.{priority}", time.monotonic() - enqueued_at)
+
+    def _dispatch(self) -> None:
+        """
+        Starts the waiting calls in turn while the concurrency and the rate limits allow
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._in_flight < self._limit:
+            for priority, queue in self._queues.items():
+                # Skip the calls cancelled while waiting
+                while queue and queue[0][3].done():
+                    heapq.heappop(queue)
+                if queue:
+                    break
+            else:
+                return
+
+            tag, _, tokens, future = queue[0]
+            tokens = min(tokens, self._tokens.capacity)
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self._requests.wait_time(1),
+                self._tokens.wait_time(tokens)
+            )
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(queue)
+            self._requests.consume(1)
+            self._tokens.consume(tokens)
+            self._virtual_time[priority] = tag
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _on_success(self, estimated_tokens: int, tokens: int) -> None:
+        self._rate_limited = 0
+        self._successes += 1
+        if self._limit < self.max_concurrency and self._successes >= self._limit:
+            self._limit += 1
+            self._successes = 0
+        if tokens:
+            # Charge the actual tokens of the call instead of the estimate
+            self._tokens.consume(tokens - estimated_tokens)
+            metrics.increment("llm_scheduler.tokens", tokens)
+        metrics.increment("llm_scheduler.calls")
+
+    def _on_rate_limited(self, error: httpx.HTTPStatusError) -> None:
+        now = time.monotonic()
+        self._rate_limited += 1
+        # Only once for the calls rate limited together
+        if now >= self._paused_until:
+            self._limit = max(1, self._limit // 2)
+            self._successes = 0
+        try:
+            pause = float(error.response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pause = min(BASE_BACKOFF * 2 ** (self._rate_limited - 1), self.max_backoff)
+        self._paused_until = max(self._paused_until, now + pause)
+        metrics.increment("llm_scheduler.rate_limited")
+
+    async def run(self, call: Callable[[], Awaitable[ChatResult]], tokens: int) -> ChatResult:
+        """
+        Runs the model call `call`, of about `tokens` tokens, in its turn
+        """
+        priority, user_id = _request.get()
+        tag = self._finish_tag(priority, user_id, tokens)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, tag, tokens)
+            try:
+                result = await call()
+            except Exception as error:
+                if not _is_rate_limited(error) or attempt == self.max_retries:
+                    raise
+                self._on_rate_limited(error)
+                continue
+            finally:
+                self._release()
+
+            self._on_success(tokens, (result.llm_output or {}).get("token_usage", {}).get("total_tokens", 0))
+            return result
+
+    async def stream(
+        self,
+        make_stream: Callable[[], AsyncIterator[ChatGenerationChunk]],
+        tokens: int
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """
+        Streams the model call `make_stream` in its turn, holding its slot until the end of the stream.
+        Only retried if rate limited before the first chunk.
+        """
+        priority, user_id = _request.get()
+        tag = self._finish_tag(priority, user_id, tokens)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, tag, tokens)
+            streamed = False
+            used_tokens = 0
+            try:
+                async for chunk in make_stream():
+                    streamed = True
+                    usage = getattr(chunk.message, "usage_metadata", None)
+                    if usage:
+                        used_tokens = usage.get("total_tokens", 0)
+                    yield chunk
+            except Exception as error:
+                if streamed or not _is_rate_limited(error) or attempt == self.max_retries:
+                    raise
+                self._on_rate_limited(error)
+                continue
+            finally:
+                self._release()
+
+            self._on_success(tokens, used_tokens)
+            return
+
+    def stats(self) -> dict:
+        return {
+            "queued": {priority: sum(not entry[3].done() for entry in queue) for priority, queue in self._queues.items()},
+            "in_flight": self._in_flight,
+            "concurrency": self._limit,
+            "paused_seconds": max(0.0, self._paused_until - time.monotonic()),
+        }
+
+
+@cache
+def get_llm_scheduler() -> LLMScheduler:
+    return LLMScheduler()
+
@@ -0,0 +1,69 @@
+import logging
+from functools import cache
+
+from langchain_core.messages import BaseMessage
+from tokenizers import Tokenizer
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Same tokenizer as the one used by langchain-mistralai to count the Mistral tokens
+TOKENIZER_ID = "mistralai/Mixtral-8x7B-v0.1"
+
+ROLES = {"human": "User", "ai": "Assistant"}
+
+
+@cache
+def get_tokenizer() -> Tokenizer | None:
+    """
+    Returns the Mistral tokenizer from Hugging Face, None if it can't be downloaded
+    """
+    try:
+        return Tokenizer.from_pretrained(TOKENIZER_ID, token=get_settings().hf_token)
+    except Exception as error:
+        logger.warning(f"Could not load the {TOKENIZER_ID} tokenizer, estimating tokens instead: {error}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        # Roughly 4 characters per token
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def render_message(message: BaseMessage) -> str:
+    """
+    Compact rendering of a message, without its metadata
+    """
+    return f"{ROLES.get(message.type, message.type)}: {message.content}"
+
+
+def split_history(messages: list[BaseMessage], token_budget: int) -> tuple[list[BaseMessage], list[BaseMessage]]:
+    """
+    Splits the messages into (older, recent), the recent ones being the latest that fit in `token_budget`.
+    The last message is always kept in the recent ones.
+    """
+    used = 0
+    start = len(messages)
+    while start > 0:
+        used += count_tokens(render_message(messages[start - 1]))
+        if used > token_budget and start < len(messages):
+            break
+        start -= 1
+    return messages[:start], messages[start:]
+
+
+def render_conversation(state: dict) -> str:
+    """
+    Renders the conversation for a prompt: the summary of the earlier messages (if any),
+    followed by the recent messages fitting in the history token budget.
+    """
+    _, recent = split_history(state.get("messages") or [], get_settings().chatbot_history_token_budget)
+
+    lines = [render_message(message) for message in recent]
+    if state.get("summary"):
+        lines.insert(0, f"Summary of the earlier conversation: {state.get('summary')}")
+    return "\n".join(lines)
@@ -5,14 +5,16 @@ from typing import Optional
 
 from langgraph.graph import add_messages
 
-from app.schemas.app import User
+from uuid import UUID
 
 
 # Define the state of the chatbot
 class State(TypedDict):
-    user: User
-    messages: Annotated[list[str], add_messages]  # conversation history of all messages
+    user_id: UUID  # the user is resolved from the request with get_user, to keep it (and its tokens) out of the checkpoints
+    messages: Annotated[list[str], add_messages]  # conversation history of the recent messages
+    summary: Optional[str]  # rolling summary of the older messages
     intent: Optional[str]  # user's current goal: generateInvoice, sendEmail, scheduleMeeting
+    intent_details_extracted: Optional[bool]  # whether the intent's details were extracted along with it
     satisfied: Optional[str]
     
     # Email related atttributes
@@ -81,6 +83,31 @@ class EmailSatisfaction(BaseModel):
     )
 
 
+class GeneratedEmail(BaseModel):
+    """A professional and polite work email generated from the conversation"""
+    subject: str = Field(description="The subject line of the email, without any additional text")
+    body: str = Field(description="The body text of the email")
+
+
 class EmailInfo(BaseModel):
     """Extracts the email details mentioned by the user"""
-    email_address: Optional[str] = Field(default=None, description="The email address of the email message recipient")
\ No newline at end of file
+    email_address: Optional[str] = Field(default=None, description="The email address of the email message recipient")
+
+class UserIntentWithDetails(BaseModel):
+    """Classifies the user's intent and extracts the details for that intent from the same message"""
+    intent: Optional[Literal[
+        "generateInvoice",
+        "sendEmail",
+        "scheduleMeeting"
+    ]] = Field(
+        default=None,
+        description=(
+            "The user's intent. Must be 'generateInvoice' if they want to create an invoice. "
+            "Must be 'sendEmail' if they want to draft or send or reply to an email. "
+            "Must be 'scheduleMeeting' if they want to arrange or book a meeting. "
+            "Return null if none of these apply."
+        )
+    )
+    invoice: Optional[InvoiceInfo] = Field(default=None, description="The invoice details, only if the intent is 'generateInvoice'")
+    meeting: Optional[MeetingInfo] = Field(default=None, description="The meeting details, only if the intent is 'scheduleMeeting'")
+    email: Optional[EmailInfo] = Field(default=None, description="The email details, only if the intent is 'sendEmail'")
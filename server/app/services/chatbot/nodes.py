@@ -1,33 +1,79 @@
+import asyncio
+
 from langchain.schema import AIMessage, HumanMessage
+from langchain_core.messages import RemoveMessage
+from langchain_core.runnables import RunnableConfig
+
+from app.config import get_settings
+from app.services.chatbot.chatbot import get_model, get_user
 
 from app.services.chatbot.helper_functions import (
-    extract_user_intent,
-    extract_invoice_info,
-    extract_meeting_info,
-    extract_email_info,
-    extract_email_satisfaction,
+    aextract_user_intent_with_details,
+    aextract_invoice_info,
+    aextract_meeting_info,
+    aextract_email_info,
+    aextract_email_satisfaction,
+    asummarise_conversation,
+    extract_details,
+    get_structured_llm,
     user_input
 )
-from app.services.chatbot.models import State
+from app.services.chatbot.intent_classifier import classify_intent
+from app.services.chatbot.llm_router import llm_task
+from app.services.chatbot.memory import count_tokens, render_conversation, render_message, split_history
+from app.services.chatbot.satisfaction_classifier import classify_email_satisfaction, record_email_satisfaction
+from app.services.chatbot.rule_extractors import (
+    extract_invoice_info_rules,
+    extract_meeting_info_rules,
+    extract_email_info_rules
+)
+from app.services.chatbot.models import State, GeneratedEmail
 
 from app.services.google import create_google_api_client, create_calendar_event
 from app.services.email import gmail_create_draft, gmail_send_draft
 
 
-async def determine_user_intent_node(model, state: State):
+# Details collected for each intent
+INTENT_DETAILS = {
+    "generateInvoice": ["name", "phone_number", "address", "item_name", "item_cost"],
+    "scheduleMeeting": ["meeting_title", "recipient_email", "start_time"],
+    "sendEmail": ["email_address"],
+}
+
+
+def _intent_update(state: State, intent: str | None, details: dict) -> dict:
+    """
+    Returns the state update for the new `intent` and the `details` found with it.
+    If the intent changed the details of the previous one are cleared, otherwise the known ones are kept.
+    """
+    if intent != state.get("intent"):
+        cleared = {key: None for keys in INTENT_DETAILS.values() for key in keys}
+        return {**cleared, **details, "intent": intent}
+    return {**{key: value or state.get(key) for key, value in details.items()}, "intent": intent}
+
+
+async def determine_user_intent_node(state: State, config: RunnableConfig):
     """
-    Node to extract the user intent from the user's message
+    Node to extract the user intent from the user's message, along with any details for that intent
     """
+    model = get_model(config)
     last_message = state.get("messages")[-1].content if state.get("messages") else ""
-    intent = extract_user_intent(model, last_message)
 
-    return {"intent": intent}
+    # Obvious messages are classified locally, the details are then extracted by the check_provided_* nodes
+    confident, intent = classify_intent(last_message)
+    if confident:
+        return {**_intent_update(state, intent, {}), "intent_details_extracted": False}
 
+    extracted_info = await aextract_user_intent_with_details(model, last_message)
+    intent = extracted_info.pop("intent")
+    return {**_intent_update(state, intent, extracted_info), "intent_details_extracted": True}
 
-async def prompt_for_correct_user_intent_node(model, state: State):
+
+async def prompt_for_correct_user_intent_node(state: State, config: RunnableConfig):
     """
     Node to inform the user of its actions
     """
+    model = get_model(config)
    
     prompt = (
         "You are a helpful assistant that guides users about supported actions. "
@@ -38,7 +84,7 @@ async def prompt_for_correct_user_intent_node(model, state: State):
         "If the user requests something else, politely explain that you cannot help with that and "
         "redirect them to one of the five supported actions.\n\n"
         "Conversation so far:\n"
-        f"{state.get('messages')}\n\n"
+        f"{render_conversation(state)}\n\n"
         "Now, respond politely to the user."
     )
 
@@ -48,7 +94,36 @@ async def prompt_for_correct_user_intent_node(model, state: State):
     }
 
 
-async def wait_for_user_input_node(model, state: State):
+async def summarise_conversation_node(state: State, config: RunnableConfig):
+    """
+    Node to compact the conversation: once the messages go over the history token budget,
+    the older ones are folded into the rolling summary and removed from the state
+    """
+    budget = get_settings().chatbot_history_token_budget
+    messages = state.get("messages") or []
+
+    if count_tokens("\n".join(render_message(message) for message in messages)) <= budget:
+        return {}
+
+    # Keep the most recent messages as they are, summarise the rest
+    older, _ = split_history(messages, budget // 2)
+    if not older:
+        return {}
+
+    model = get_model(config)
+    summary = await asummarise_conversation(
+        model,
+        state.get("summary"),
+        "\n".join(render_message(message) for message in older)
+    )
+
+    return {
+        "summary": summary,
+        "messages": [RemoveMessage(id=message.id) for message in older]
+    }
+
+
+async def wait_for_user_input_node(state: State):
     """
     Node to request user input
     """ 
@@ -60,14 +135,19 @@ async def wait_for_user_input_node(model, state: State):
     }
 
 
-async def check_provided_invoice_details_node(model, state: State):
+async def check_provided_invoice_details_node(state: State, config: RunnableConfig):
     """
     Node to check if any invoice details are provided, if not tries to extract it from the last user message
     """
+    model = get_model(config)
     
     # Extract provided service details from the last user message
     last_message = state.get("messages")[-1].content if state.get("messages") else ""
-    extracted_info = extract_invoice_info(model, last_message)
+    extracted_info = await extract_details(
+        model, state, last_message,
+        INTENT_DETAILS["generateInvoice"],
+        extract_invoice_info_rules, aextract_invoice_info
+    )
     
     return {
         "name": extracted_info.get("name") or state.get("name"),
@@ -78,7 +158,7 @@ async def check_provided_invoice_details_node(model, state: State):
     }
 
 
-async def ask_for_invoice_details_node(model, state: State):
+async def ask_for_invoice_details_node(state: State):
     """
     Node to check which invoice details are missing and ask the user for them
     """
@@ -108,7 +188,7 @@ async def ask_for_invoice_details_node(model, state: State):
     }
 
 
-async def generate_invoice_node(model, state: State):
+async def generate_invoice_node(state: State):
     """
     Node to generate an invoice
     """
@@ -134,14 +214,19 @@ async def generate_invoice_node(model, state: State):
     }
 
 
-async def check_provided_meeting_details_node(model, state: State):
+async def check_provided_meeting_details_node(state: State, config: RunnableConfig):
     """
     Node to check if any meeting details are provided, if not tries to extract it from the last user message
     """
+    model = get_model(config)
     
     # Extract provided meeting details from the last user message
     last_message = state.get("messages")[-1].content if state.get("messages") else ""
-    extracted_info = extract_meeting_info(model, last_message)
+    extracted_info = await extract_details(
+        model, state, last_message,
+        INTENT_DETAILS["scheduleMeeting"],
+        extract_meeting_info_rules, aextract_meeting_info
+    )
     
     return {
         "meeting_title": extracted_info.get("meeting_title") or state.get("meeting_title"),
@@ -150,7 +235,7 @@ async def check_provided_meeting_details_node(model, state: State):
     }
 
 
-async def ask_for_meeting_details_node(model, state: State):
+async def ask_for_meeting_details_node(state: State):
     """
     Node to check which meeting details are missing and ask the user for them
     """
@@ -180,14 +265,14 @@ async def ask_for_meeting_details_node(model, state: State):
     }
 
 
-async def schedule_meeting_node(model, state: State):
+async def schedule_meeting_node(state: State, config: RunnableConfig):
     """
     Node to schedule a meeting
     """
     meeting_title = state.get("meeting_title")
     recipient_email = state.get("recipient_email")
     start_time = state.get("start_time")
-    user = state.get("user")
+    user = await get_user(state, config)
 
     calendar_client = create_google_api_client("calendar", user)
 
@@ -205,65 +290,96 @@ async def schedule_meeting_node(model, state: State):
     }
 
 
-async def generate_email_node(model, state: State):
+@llm_task("generation")
+async def generate_email_node(state: State, config: RunnableConfig):
     """
     Node to generate an email
     """
+    model = get_model(config)
+
+    email_sender = (await get_user(state, config)).name
+
+    if get_settings().email_generation_mode == "structured":
+        # Generate the subject and the body in a single call
+        email_prompt = (
+            f"You are an AI assistant tasked with drafting a professional and polite work email.\n"
+            f"The sender of the email is: {email_sender}\n\n"
+            f"Conversation context:\n{render_conversation(state)}\n\n"
+            "Write the subject line and the email body text. The body must not include a subject line, "
+            "greeting, closing, or signature unless explicitly required by the context."
+        )
+        email = await get_structured_llm(model, GeneratedEmail).ainvoke(email_prompt)
+        subject, body = email.subject, email.body
 
-    email_sender = state.get("user").name
+    else:
+        body_prompt = (
+            f"You are an AI assistant tasked with drafting only the body of a professional and polite work email.\n"
+            f"The sender of the email is: {email_sender}\n\n"
+            f"Conversation context:\n{render_conversation(state)}\n\n"
+            "Write only the email body text. Do not include a subject line, greeting, closing, or signature unless explicitly required by the context."
+        )
 
-    body_prompt = (
-        f"You are an AI assistant tasked with drafting only the body of a professional and polite work email.\n"
-        f"The sender of the email is: {email_sender}\n\n"
-        f"Conversation context:\n{state.get('messages')}\n\n"
-        "Write only the email body text. Do not include a subject line, greeting, closing, or signature unless explicitly required by the context."
-    )
+        subject_prompt = (
+            f"You are an AI assistant tasked with drafting only the subject line for a professional and polite work email.\n"
+            f"Conversation context:\n{render_conversation(state)}\n\n"
+            "Write only the subject line. Do not include any additional text, explanations, or the email body."
+        )
 
-    subject_prompt = (
-        f"You are an AI assistant tasked with drafting only the subject line for a professional and polite work email.\n"
-        f"Conversation context:\n{state.get('messages')}\n\n"
-        "Write only the subject line. Do not include any additional text, explanations, or the email body."
-    )
+        # The subject and the body only depend on the conversation, generate them concurrently
+        subject_response, body_response = await asyncio.gather(
+            model.ainvoke(subject_prompt, config={"tags": ["email_subject"]}),
+            model.ainvoke(body_prompt, config={"tags": ["email_body"]})
+        )
+        subject, body = subject_response.content, body_response.content
 
-    subject = await model.ainvoke(subject_prompt)
-    response = await model.ainvoke(body_prompt)
     return {
-        "messages": [AIMessage(content=f"Here's an email I generated:\n\nSubject: {subject.content}\n Body:{response.content}. Would you like me to send it?")],
-        "email_subject": subject.content,
-        "generated_email": response.content
+        "messages": [AIMessage(content=f"Here's an email I generated:\n\nSubject: {subject}\n Body:{body}. Would you like me to send it?")],
+        "email_subject": subject,
+        "generated_email": body
     }
 
 
-async def check_provided_email_details_node(model, state: State):
+async def check_provided_email_details_node(state: State, config: RunnableConfig):
     """
     Node to check if any email details are provided, if not tries to extract it from the last user message
     """
+    model = get_model(config)
     
     # Extract provided meeting details from the last user message
     last_message = state.get("messages")[-1].content if state.get("messages") else ""
-    extracted_info = extract_email_info(model, last_message)
+    extracted_info = await extract_details(
+        model, state, last_message,
+        INTENT_DETAILS["sendEmail"],
+        extract_email_info_rules, aextract_email_info
+    )
     
     return {
-        "email_address": extracted_info.get("email_address")
+        "email_address": extracted_info.get("email_address") or state.get("email_address")
     }
 
 
-async def determine_email_satisfaction_node(model, state: State):
+async def determine_email_satisfaction_node(state: State, config: RunnableConfig):
     """
     Node to extract satisfaction about the generated email
     """
+    model = get_model(config)
     last_message = state.get("messages")[-1].content if state.get("messages") else ""
-    satisfied = extract_email_satisfaction(model, last_message)
+
+    # Obvious replies are classified locally, only the ambiguous ones are escalated to the LLM
+    satisfied = classify_email_satisfaction(last_message)
+    record_email_satisfaction(escalated=satisfied is None)
+    if satisfied is None:
+        satisfied = await aextract_email_satisfaction(model, last_message)
 
     return {"satisfied": satisfied}
 
 
-async def send_email_node(model, state: State):
+async def send_email_node(state: State, config: RunnableConfig):
     """
     Node to send an email
     """
     
-    current_user = state.get("user")
+    current_user = await get_user(state, config)
     to = state.get("email_address")
     subject = state.get("email_subject")
     body = state.get("generated_email")
@@ -278,7 +394,7 @@ async def send_email_node(model, state: State):
     }
 
 
-async def ask_for_email_details_node(model, state: State):
+async def ask_for_email_details_node(state: State):
     """
     Node to check which email details are missing and ask the user for them
     """
@@ -301,4 +417,8 @@ async def ask_for_email_details_node(model, state: State):
         prompt_text = (
             f"I am happy to help you send an email. "
             f"Could you please provide the {fields_phrase} for the email?"
-        )
\ No newline at end of file
+        )
+
+    return {
+        "messages": [AIMessage(content=prompt_text)]
+    }
@@ -0,0 +1,143 @@
+import re
+from datetime import datetime, timedelta
+
+from app.utils import metrics
+
+
+# Precompiled patterns for the details that can be parsed without the LLM
+EMAIL_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+PHONE_RE = re.compile(r"(?<![\w.])\+?\(?\d[\d\s().-]{6,}\d(?![\w])")
+# A bare run of digits (eg: "order 12345678") is only taken for a phone number next to these words
+PHONE_CONTEXT_RE = re.compile(r"\b(?:phone|mobile|cell|tel|telephone|call|whatsapp|sms|contact)\b", re.IGNORECASE)
+AMOUNT_RE = re.compile(
+    r"(?:[$€£]|\b(?:aud|usd|eur|gbp)\s?)(?P<prefixed>\d[\d,]*(?:\.\d{1,2})?)"
+    r"|(?P<suffixed>\d[\d,]*(?:\.\d{1,2})?)\s?(?:aud|usd|eur|gbp|dollars?)\b",
+    re.IGNORECASE
+)
+ISO_DATETIME_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2})?\b")
+ISO_DATE_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+RELATIVE_DAY_RE = re.compile(r"\b(today|tomorrow)\b", re.IGNORECASE)
+RELATIVE_OFFSET_RE = re.compile(r"\bin (\d+) (minute|hour)s?\b", re.IGNORECASE)
+TIME_RE = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)\b|\b(\d{1,2}):(\d{2})\b", re.IGNORECASE)
+
+# A phone number has between 8 and 15 digits (E.164)
+PHONE_DIGITS = range(8, 16)
+
+
+def _single(matches: list):
+    """
+    Returns the only distinct match, None if there is none or the match is ambiguous
+    """
+    distinct = set(matches)
+    return distinct.pop() if len(distinct) == 1 else None
+
+
+def _record(slot: str, value) -> None:
+    metrics.increment(f"rule_extraction.{slot}.{'hit' if value is not None else 'miss'}")
+
+
+def parse_email_address(message: str) -> str | None:
+    return _single(EMAIL_RE.findall(message))
+
+
+def parse_phone_number(message: str) -> str | None:
+    # Remove what could be mistaken for a phone number first
+    for pattern in (EMAIL_RE, ISO_DATETIME_RE, ISO_DATE_RE, AMOUNT_RE):
+        message = pattern.sub(" ", message)
+
+    candidates = [
+        match.strip() for match in PHONE_RE.findall(message)
+        if sum(char.isdigit() for char in match) in PHONE_DIGITS
+    ]
+    if PHONE_CONTEXT_RE.search(message) is None:
+        # Only the formatted numbers (eg: "+61 412 345 678", "(02) 9876-5432")
+        candidates = [candidate for candidate in candidates if not candidate.isdigit()]
+    return _single(candidates)
+
+
+def parse_amount(message: str) -> float | None:
+    amounts = [
+        float((match.group("prefixed") or match.group("suffixed")).replace(",", ""))
+        for match in AMOUNT_RE.finditer(message)
+    ]
+    return _single(amounts)
+
+
+def _parse_time(message: str) -> tuple[int, int] | None:
+    times = []
+    for match in TIME_RE.finditer(message):
+        if match.group(3):
+            hour, minute = int(match.group(1)) % 12, int(match.group(2) or 0)
+            if match.group(3).lower() == "pm":
+                hour += 12
+        else:
+            hour, minute = int(match.group(4)), int(match.group(5))
+        if hour < 24 and minute < 60:
+            times.append((hour, minute))
+    return _single(times)
+
+
+def parse_datetime(message: str, now: datetime | None = None) -> datetime | None:
+    """
+    Parses an ISO 8601 datetime, or a relative one (eg: 'tomorrow at 3pm', 'in 2 hours').
+    Returns None if there is no datetime, only a date without a time, or more than one.
+    """
+    now = now or datetime.now()
+
+    iso = _single(ISO_DATETIME_RE.findall(message))
+    if iso is not None:
+        try:
+            return datetime.fromisoformat(iso)
+        except ValueError:
+            return None
+
+    offset = _single([(int(amount), unit.lower()) for amount, unit in RELATIVE_OFFSET_RE.findall(message)])
+    if offset is not None:
+        amount, unit = offset
+        return (now + timedelta(**{f"{unit}s": amount})).replace(second=0, microsecond=0)
+
+    day = _single([day.lower() for day in RELATIVE_DAY_RE.findall(message)])
+    time = _parse_time(message)
+    if day is None or time is None:
+        return None
+
+    date = now.date() + timedelta(days=1 if day == "tomorrow" else 0)
+    return datetime(date.year, date.month, date.day, *time)
+
+
+def extract_invoice_info_rules(message: str) -> dict:
+    """
+    Extracts the invoice details that can be parsed without the LLM.
+    Returns dict with the 'phone_number' and 'item_cost' fields, None if not found confidently.
+    """
+    info = {
+        "phone_number": parse_phone_number(message),
+        "item_cost": parse_amount(message)
+    }
+    for slot, value in info.items():
+        _record(slot, value)
+    return info
+
+
+def extract_meeting_info_rules(message: str, now: datetime | None = None) -> dict:
+    """
+    Extracts the meeting details that can be parsed without the LLM.
+    Returns dict with the 'recipient_email' and 'start_time' fields, None if not found confidently.
+    """
+    info = {
+        "recipient_email": parse_email_address(message),
+        "start_time": parse_datetime(message, now)
+    }
+    for slot, value in info.items():
+        _record(slot, value)
+    return info
+
+
+def extract_email_info_rules(message: str) -> dict:
+    """
+    Extracts the email details that can be parsed without the LLM.
+    Returns dict with the 'email_address' field, None if not found confidently.
+    """
+    info = {"email_address": parse_email_address(message)}
+    _record("email_address", info["email_address"])
+    return info
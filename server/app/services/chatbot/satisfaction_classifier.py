@@ -0,0 +1,50 @@
+import re
+
+from app.utils import metrics
+
+
+# Replies longer than this are left to the LLM, they usually carry specific feedback
+MAX_WORDS = 12
+
+AFFIRMATIVE_RE = re.compile(
+    r"\b(?:yes|yeah|yep|yup|ya|sure|ok|okay|k|perfect|great|good|nice|fine|correct|approved?|lgtm|"
+    r"send(?: it)?|go ahead|do it|that works|all good|love it|thanks?|thank you)\b|👍",
+    re.IGNORECASE
+)
+# Negations approving the email (eg: "no changes needed", "not bad"), taken out before looking for negative words
+APPROVING_NEGATION_RE = re.compile(
+    r"\b(?:(?:no|not any|nothing to)(?: more)? (?:changes?|edits?|problems?|issues?|worries|complaints?)"
+    r"(?: (?:needed|required|necessary))?|(?:don'?t|do not) (?:change|edit) anything|not bad(?: at all)?|"
+    r"why not)\b\??",
+    re.IGNORECASE
+)
+NEGATIVE_RE = re.compile(
+    r"\b(?:no|nope|nah|not|don'?t|do not|wrong|change|edit|rewrite|redo|fix|shorter|longer|"
+    r"instead|remove|add|but|make it|more|less|cancel|wait|stop)\b|\?",
+    re.IGNORECASE
+)
+
+
+def classify_email_satisfaction(message: str) -> str | None:
+    """
+    Classifies obvious replies to a generated email without the LLM.
+    Returns 'True' if clearly satisfied, 'False' if clearly not, None if ambiguous.
+    """
+    if len(message.split()) > MAX_WORDS:
+        return None
+
+    rest, approving_negations = APPROVING_NEGATION_RE.subn(" ", message)
+    affirmative = approving_negations > 0 or AFFIRMATIVE_RE.search(rest) is not None
+    negative = NEGATIVE_RE.search(rest) is not None
+
+    # Mixed replies (eg: "yes but shorter", "not bad, make it shorter") are left to the LLM
+    if affirmative == negative:
+        return None
+    return "True" if affirmative else "False"
+
+
+def record_email_satisfaction(escalated: bool) -> None:
+    metrics.increment(f"email_satisfaction.{'escalated' if escalated else 'local'}")
+
+
+metrics.register_rate("email_satisfaction.escalation_rate", "email_satisfaction.escalated", "email_satisfaction.local")
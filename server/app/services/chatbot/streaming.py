@@ -0,0 +1,45 @@
+import json
+from typing import AsyncIterator
+
+from langgraph.graph.state import CompiledStateGraph
+
+
+# Nodes whose model tokens are shown to the user as they are generated
+STREAMED_NODES = {"prompt_for_correct_user_intent", "generate_email"}
+
+# Tags of the model calls running concurrently in a node, to tell their tokens apart
+STREAMED_TAGS = {"email_subject", "email_body"}
+
+
+def format_sse(event: str, data) -> str:
+    """
+    Formats a server-sent event
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_chat_events(graph: CompiledStateGraph, graph_input, config: dict) -> AsyncIterator[str]:
+    """
+    Runs a chat turn and yields it as server-sent events:
+    - node: a node of the graph started
+    - token: a model token generated by a user facing node
+    - interrupt: the graph is waiting for the user's input
+    - message: the chatbot's final reply (same as the non streaming endpoint)
+    """
+    async for event in graph.astream_events(graph_input, config, version="v2"):
+        node = event["metadata"].get("langgraph_node")
+
+        if event["event"] == "on_chain_start" and event["name"] == node:
+            yield format_sse("node", {"node": node})
+
+        elif event["event"] == "on_chat_model_stream" and node in STREAMED_NODES:
+            content = event["data"]["chunk"].content
+            if content:
+                field = next((tag for tag in event["tags"] if tag in STREAMED_TAGS), None)
+                yield format_sse("token", {"node": node, "field": field, "content": content})
+
+    snapshot = await graph.aget_state(config)
+    for graph_interrupt in snapshot.interrupts:
+        yield format_sse("interrupt", graph_interrupt.value)
+
+    yield format_sse("message", snapshot.values["messages"][-1].content)
@@ -1,4 +1,7 @@
 import base64
+import json
+import sys
+import time
 from email.message import EmailMessage
 
 from google.oauth2.credentials import Credentials
@@ -11,6 +14,11 @@ import requests
 from app.schemas.app import User
 from ..routers.oauth import SCOPES
 
+# Messages fetched per Gmail batch request (at most 100, Google advises 50 not to be rate limited)
+GMAIL_BATCH_SIZE = 50
+# Headers fetched for the list views
+METADATA_HEADERS = ["From", "To", "Subject", "Date"]
+
 def get_credentials(user: User) -> Credentials:
   settings = get_settings()
   creds = Credentials(
@@ -131,6 +139,39 @@ def gmail_get_message(service, msg_id, user_id="me", format="full"):
         print(f"An error occurred fetching message {msg_id}: {error}")
         return None
 
+def gmail_get_messages(service, msg_ids, user_id="me", format="full", metadata_headers=None):
+    """
+    Fetch messages by ID with Gmail batch requests, one HTTP round trip per GMAIL_BATCH_SIZE messages.
+    format can be "full", "raw", "metadata", or "minimal", `metadata_headers` restricts the "metadata" headers.
+    Returns the message resource dicts by ID, without the messages that could not be fetched.
+    """
+    messages = {}
+
+    def _callback(request_id, response, exception):
+        if exception is not None:
+            print(f"An error occurred fetching message {request_id}: {exception}")
+            return
+        messages[request_id] = response
+
+    for start in range(0, len(msg_ids), GMAIL_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=_callback)
+        for msg_id in msg_ids[start:start + GMAIL_BATCH_SIZE]:
+            batch.add(
+                service.users().messages().get(
+                    userId=user_id,
+                    id=msg_id,
+                    format=format,
+                    metadataHeaders=metadata_headers
+                ),
+                request_id=msg_id
+            )
+        try:
+            batch.execute()
+        except HttpError as error:
+            print(f"An error occurred fetching a batch of messages: {error}")
+
+    return messages
+
 def parse_message_body(message):
     """
     Given a message (as returned with format="full"), extract the body text.
@@ -166,32 +207,86 @@ def parse_message_body(message):
 
     return {"text": body_text, "html": body_html}
 
-def gmail_read_inbox(user: User, max_msgs=10, label_ids=None, query="is:unread"):
+def get_gmail_service(user: User):
+    return build("gmail", "v1", credentials=get_credentials(user))
+
+def gmail_read_inbox(user: User, max_msgs=10, label_ids=None, query="is:unread", with_body=True):
     """
     Top-level function to list and read recent messages for a given user.
+    Without `with_body`, only the headers are fetched (for list views), "body" is then None and can be
+    loaded on demand with gmail_read_message_body.
     """
-    creds = get_credentials(user)
-    service = build("gmail", "v1", credentials=creds)
+    service = get_gmail_service(user)
 
     if label_ids is None:
       label_ids = ["INBOX"]
 
     msgs = gmail_list_messages(service, user_id="me", label_ids=label_ids, query=query, max_results=max_msgs)
+    msg_ids = [m["id"] for m in msgs]
+    if with_body:
+        fetched = gmail_get_messages(service, msg_ids, format="full")
+    else:
+        fetched = gmail_get_messages(service, msg_ids, format="metadata", metadata_headers=METADATA_HEADERS)
+
     results = []
-    for m in msgs:
-        msg_id = m["id"]
-        full = gmail_get_message(service, msg_id, format="full")
-        if not full:
+    for msg_id in msg_ids:
+        message = fetched.get(msg_id)
+        if not message:
             continue
-        snippet = full.get("snippet")
-        headers = full.get("payload", {}).get("headers", [])
-        # extract subject, from, to, etc.
-        header_map = {h.get("name"): h.get("value") for h in headers}
-        body = parse_message_body(full)
+        headers = message.get("payload", {}).get("headers", [])
         results.append({
             "id": msg_id,
-            "snippet": snippet,
-            "headers": header_map,
-            "body": body
+            "snippet": message.get("snippet"),
+            # extract subject, from, to, etc.
+            "headers": {h.get("name"): h.get("value") for h in headers},
+            "body": parse_message_body(message) if with_body else None
         })
-    return results
\ No newline at end of file
+    return results
+
+def gmail_read_message_body(user: User, msg_id: str):
+    """
+    Loads the body of one message, as listed by gmail_read_inbox without the body.
+    Returns a dict like {"text": ..., "html": ...}, None if the message could not be fetched.
+    """
+    message = gmail_get_message(get_gmail_service(user), msg_id, format="full")
+    return parse_message_body(message) if message else None
+
+
+def benchmark(counts: list[int], latency: float = 0.02) -> dict:
+    """
+    Reads `count` messages from a fake Gmail (see fake_gmail.py) answering each HTTP request in `latency` seconds,
+    with one request per message vs batch requests:
+
+        python -m app.services.email benchmark [<messages> ...]
+    """
+    from app.services.fake_gmail import FakeGmail
+
+    results = {}
+    with FakeGmail(latency) as gmail:
+        for _ in range(max(counts)):
+            gmail.add_message()
+        service = gmail.service()
+
+        for count in counts:
+            result = results[count] = {}
+            for name in ("sequential", "batched"):
+                gmail.requests = 0
+                start = time.perf_counter()
+                msg_ids = [m["id"] for m in gmail_list_messages(service, label_ids=["INBOX"], max_results=count)]
+                if name == "sequential":
+                    messages = [gmail_get_message(service, msg_id) for msg_id in msg_ids]
+                else:
+                    messages = list(gmail_get_messages(service, msg_ids).values())
+                elapsed = time.perf_counter() - start
+                assert len(messages) == count
+                result[name] = {"seconds": elapsed, "http_requests": gmail.requests}
+
+    return {"latency": latency, "messages": results}
+
+
+if __name__ == "__main__":
+    command, *args = sys.argv[1:]
+    if command == "benchmark":
+        print(json.dumps(benchmark([int(arg) for arg in args] or [10, 100, 500]), indent=2))
+    else:
+        raise SystemExit(f"Unknown command: {command}")
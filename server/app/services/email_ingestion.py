@@ -0,0 +1,161 @@
+"""
+Bulk ingestion of emails (Gmail sync, backfills), a whole batch in one transaction.
+
+Small batches are written with multi-row INSERT ... RETURNING statements, large ones are streamed with COPY
+into a temporary table and moved with a single INSERT ... SELECT ... RETURNING.
+Both upsert on (user_id, gmail_message_id).
+
+Benchmark (per-row commits vs multi-row INSERT vs COPY, the emails are deleted afterwards):
+
+    python -m app.services.email_ingestion benchmark [<emails>]
+"""
+import asyncio
+import json
+import sys
+import time
+from uuid import uuid4
+
+from sqlalchemy import column, table, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.schemas.app import Email, User
+from app.utils import metrics
+
+COLUMNS = [
+    "email_id", "user_id", "gmail_message_id", "gmail_thread_id", "from_sender", "email_subject",
+    "email_status", "email_timestamp", "full_content", "summary", "draft_response"
+]
+
+# Rows per INSERT statement, postgres allows at most 65535 parameters per statement
+INSERT_CHUNK_SIZE = 1000
+# From this many rows, COPY (and its temporary table) is faster than INSERT statements
+COPY_THRESHOLD = 50
+
+
+def _to_row(email: dict) -> dict:
+    row = {name: None for name in COLUMNS}
+    row["email_id"] = uuid4()
+    row.update(email)
+    return row
+
+
+def _upsert(statement, update_columns: list[str]):
+    if not update_columns:
+        return statement.on_conflict_do_nothing(constraint="email_user_id_gmail_message_id_key")
+    return statement.on_conflict_do_update(
+        constraint="email_user_id_gmail_message_id_key",
+        set_={name: statement.excluded[name] for name in update_columns}
+    )
+
+
+async def _insert_rows(session: AsyncSession, rows: list[dict], update_columns: list[str]) -> list[Email]:
+    emails = []
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        statement = _upsert(insert(Email).values(rows[start:start + INSERT_CHUNK_SIZE]), update_columns)
+        emails += (await session.exec(statement.returning(Email))).scalars().all()
+    return emails
+
+
+async def _copy_rows(session: AsyncSession, rows: list[dict], update_columns: list[str]) -> list[Email]:
+    await session.exec(text(
+        "CREATE TEMP TABLE email_staging (LIKE email INCLUDING DEFAULTS) ON COMMIT DROP"
+    ))
+
+    # COPY goes through the psycopg connection of the session, in the same transaction
+    connection = await (await session.connection()).get_raw_connection()
+    async with connection.driver_connection.cursor() as cursor:
+        async with cursor.copy(f"COPY email_staging ({', '.join(COLUMNS)}) FROM STDIN") as copy:
+            for row in rows:
+                await copy.write_row([row[name] for name in COLUMNS])
+
+    staging = table("email_staging", *[column(name) for name in COLUMNS])
+    statement = _upsert(insert(Email).from_select(COLUMNS, select(*staging.columns)), update_columns)
+    emails = (await session.exec(
+        select(Email).from_statement(statement.returning(Email))
+    )).scalars().all()
+
+    await session.exec(text("DROP TABLE email_staging"))
+    return list(emails)
+
+
+async def ingest_emails(
+    session: AsyncSession,
+    emails: list[dict],
+    update_columns: list[str] | None = None,
+    commit: bool = True
+) -> list[Email]:
+    """
+    Writes the `emails` (dicts of email columns, email_id generated if missing) in one transaction.
+    An email already stored (same user and gmail_message_id) gets its `update_columns` updated, or is left
+    as is without them. Returns the rows inserted or updated.
+    """
+    if not emails:
+        return []
+
+    rows = [_to_row(email) for email in emails]
+    if len(rows) >= COPY_THRESHOLD:
+        result = await _copy_rows(session, rows, update_columns or [])
+    else:
+        result = await _insert_rows(session, rows, update_columns or [])
+
+    if commit:
+        await session.commit()
+    metrics.increment("email_ingestion.emails", len(result))
+    return result
+
+
+async def benchmark(count: int) -> dict:
+    """
+    Inserts `count` synthetic emails with each strategy, deleting them after each
+    """
+    from app.db.connection import get_async_engine
+    from app.db.pool import get_connection_pool
+
+    async with get_connection_pool():
+        async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+            user = (await session.exec(select(User).limit(1))).first()
+            if user is None:
+                raise SystemExit("The benchmark needs at least one user")
+            user_id = user.user_id
+
+        def synthetic():
+            return [
+                {"user_id": user_id, "gmail_message_id": f"benchmark-{uuid4()}", "from_sender": "a@b.c",
+                 "email_subject": f"Subject {i}", "email_status": "unread", "full_content": "Hello " * 50}
+                for i in range(count)
+            ]
+
+        results = {}
+        for name in ("per_row_commit", "insert", "copy"):
+            emails = synthetic()
+            async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+                start = time.perf_counter()
+                if name == "per_row_commit":
+                    for email in emails:
+                        row = Email(**email)
+                        session.add(row)
+                        await session.commit()
+                        await session.refresh(row)
+                elif name == "insert":
+                    await _insert_rows(session, [_to_row(email) for email in emails], [])
+                    await session.commit()
+                else:
+                    await _copy_rows(session, [_to_row(email) for email in emails], [])
+                    await session.commit()
+                elapsed = time.perf_counter() - start
+
+                await session.exec(text("DELETE FROM email WHERE gmail_message_id LIKE 'benchmark-%'"))
+                await session.commit()
+            results[name] = {"seconds": elapsed, "emails_per_second": count / elapsed}
+
+        return {"emails": count, **results}
+
+
+if __name__ == "__main__":
+    command, *args = sys.argv[1:]
+    if command == "benchmark":
+        print(json.dumps(asyncio.run(benchmark(int(args[0]) if args else 10_000)), indent=2))
+    else:
+        raise SystemExit(f"Unknown command: {command}")
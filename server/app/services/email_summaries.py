@@ -0,0 +1,195 @@
+"""
+Batch AI summarisation of the stored emails lacking a summary.
+
+Emails are read in batches (by email_id, so one run visits each email once), and their contents hashed after
+normalisation (whitespace, quoting, forwarded message headers), so that identical or forwarded bodies share
+a hash. Summaries are cached by hash in the email_summary table: only the hashes never summarised go to the
+LLM, with a bounded concurrency `abatch`. Each batch is written back in bulk and committed, so a run
+interrupted by a crash resumes where it stopped, without summarising anything again.
+
+    python -m app.services.email_summaries [<user_id>]
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sys
+import time
+from uuid import UUID
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import get_settings
+from app.db.connection import get_async_engine
+from app.schemas.app import Email, EmailSummary
+from app.services.chatbot.chatbot import get_chatbot
+from app.services.chatbot.email import Summary, summary_prompt_template
+from app.services.chatbot.helper_functions import get_structured_llm
+from app.services.chatbot.llm_cache import cache_template
+from app.services.chatbot.llm_router import llm_task
+from app.services.chatbot.llm_scheduler import llm_priority
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_MARKER_RE = re.compile(r"^-+ ?(?:Forwarded message|Original Message) ?-+$", re.IGNORECASE)
+FORWARDED_HEADER_RE = re.compile(r"^(?:From|Sent|Date|Subject|To|Cc):", re.IGNORECASE)
+QUOTE_PREFIX_RE = re.compile(r"^(?:>\s?)+")
+
+
+def normalise_content(content: str) -> str:
+    """
+    Removes what differs between copies of the same email: forwarding headers, quote prefixes, whitespace
+    """
+    lines = []
+    in_forwarded_headers = False
+    for line in content.splitlines():
+        line = QUOTE_PREFIX_RE.sub("", line).strip()
+        if FORWARDED_MARKER_RE.match(line):
+            in_forwarded_headers = True
+            continue
+        if in_forwarded_headers:
+            if FORWARDED_HEADER_RE.match(line) or not line:
+                continue
+            in_forwarded_headers = False
+        if line:
+            lines.append(" ".join(line.split()))
+    return "\n".join(lines)
+
+
+def hash_content(content: str) -> str:
+    return hashlib.sha256(normalise_content(content).encode()).hexdigest()
+
+
+@llm_task("summarisation")
+@cache_template("email_summary")
+async def summarise_contents(contents: dict[str, str]) -> dict[str, str]:
+    """
+    Summarises the contents by hash with the LLM, in one bounded concurrency batch.
+    Returns the summaries by hash, without the ones that failed.
+    """
+    hashes = list(contents)
+    prompts = [summary_prompt_template.invoke({"text": contents[content_hash]}) for content_hash in hashes]
+    results = await get_structured_llm(get_chatbot(), Summary).abatch(
+        prompts,
+        config={"max_concurrency": get_settings().summary_concurrency},
+        return_exceptions=True
+    )
+
+    summaries = {}
+    for content_hash, result in zip(hashes, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not summarise content {content_hash}: {result}")
+            metrics.increment("email_summaries.failed")
+        else:
+            summaries[content_hash] = result.summary
+    return summaries
+
+
+async def summarise_batch(session: AsyncSession, emails: list[tuple[UUID, str]]) -> int:
+    """
+    Summarises the (email_id, full_content) emails, reusing the cached summaries. Returns the emails summarised.
+    """
+    hashes = {email_id: hash_content(content) for email_id, content in emails}
+    cached = dict((await session.exec(
+        select(EmailSummary.content_hash, EmailSummary.summary)
+        .where(EmailSummary.content_hash.in_(set(hashes.values())))
+    )).all())
+
+    # Identical contents in the batch are summarised once
+    missing = {hashes[email_id]: content for email_id, content in emails if hashes[email_id] not in cached}
+    metrics.increment("email_summaries.cache_hit", len(emails) - len(missing))
+    if missing:
+        # Don't hold a database connection during the LLM calls
+        await session.commit()
+        summaries = await summarise_contents(missing)
+        metrics.increment("email_summaries.llm_calls", len(missing))
+        if summaries:
+            await session.exec(insert(EmailSummary).values([
+                {"content_hash": content_hash, "summary": summary} for content_hash, summary in summaries.items()
+            ]).on_conflict_do_nothing())
+        cached.update(summaries)
+
+    rows = [
+        {"b_email_id": email_id, "b_content_hash": content_hash, "b_summary": cached[content_hash]}
+        for email_id, content_hash in hashes.items() if content_hash in cached
+    ]
+    if rows:
+        # executemany, one round trip with the psycopg pipeline
+        connection = await session.connection()
+        await connection.execute(
+            update(Email.__table__)
+            .where(Email.__table__.c.email_id == bindparam("b_email_id"))
+            .values(content_hash=bindparam("b_content_hash"), summary=bindparam("b_summary")),
+            rows
+        )
+    await session.commit()
+    return len(rows)
+
+
+async def summarise_pending_emails(user_id: UUID | None = None, max_batches: int | None = None) -> dict:
+    """
+    Summarises every email lacking a summary (of `user_id` only if given), batch by batch, or only the first
+    `max_batches` batches. Returns the number of emails summarised, the throughput in emails per minute, and
+    whether emails are left to summarise.
+    """
+    batch_size = get_settings().summary_batch_size
+    summarised = visited = batches = 0
+    last_id = None
+    pending = False
+    start = time.perf_counter()
+
+    def pending_emails():
+        query = select(Email.email_id, Email.full_content).where(
+            Email.summary.is_(None), Email.full_content.is_not(None)
+        )
+        if user_id is not None:
+            query = query.where(Email.user_id == user_id)
+        if last_id is not None:
+            query = query.where(Email.email_id > last_id)
+        return query.order_by(Email.email_id)
+
+    # Behind the chat and the drafts in the LLM queues
+    with llm_priority("batch", user_id):
+        async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+            while True:
+                if max_batches is not None and batches == max_batches:
+                    pending = (await session.exec(pending_emails().limit(1))).first() is not None
+                    break
+                emails = (await session.exec(pending_emails().limit(batch_size))).all()
+                if not emails:
+                    break
+
+                summarised += await summarise_batch(session, emails)
+                visited += len(emails)
+                batches += 1
+                last_id = emails[-1][0]
+
+    elapsed = time.perf_counter() - start
+    metrics.increment("email_summaries.summarised", summarised)
+    stats = {
+        "emails": visited,
+        "summarised": summarised,
+        "seconds": elapsed,
+        "emails_per_minute": summarised / elapsed * 60 if elapsed else 0.0,
+        "pending": pending,
+    }
+    logger.info(f"Summarised emails: {stats}")
+    return stats
+
+
+metrics.register_rate("email_summaries.cache_hit_rate", "email_summaries.cache_hit", "email_summaries.llm_calls")
+
+
+if __name__ == "__main__":
+    from app.db.pool import get_connection_pool
+
+    async def main():
+        async with get_connection_pool():
+            return await summarise_pending_emails(UUID(sys.argv[1]) if len(sys.argv) > 1 else None)
+
+    print(json.dumps(asyncio.run(main()), indent=2))
@@ -0,0 +1,224 @@
+"""
+In-memory stand-in for the Gmail API, served over HTTP on localhost, for the benchmarks and the tests:
+
+    with FakeGmail(latency=0.02) as gmail:
+        msg_id = gmail.add_message()
+        service = gmail.service()  # Gmail API client of the fake mailbox
+
+Serves users.getProfile, users.messages.list (labelIds, "is:unread" query), users.messages.get,
+users.history.list and the batch endpoint. Each HTTP request (a whole batch counting once) takes `latency`
+seconds, and is counted in `requests`. After `expire_history`, listing the history from an older history id
+fails with 404, as Gmail does once a cursor is about a week old.
+"""
+import base64
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.http import BatchHttpRequest
+
+MESSAGE_PATH_RE = re.compile(r"/users/me/messages/([^/]+)$")
+BOUNDARY_RE = re.compile(r'boundary="?([^";]+)')
+CONTENT_ID_RE = re.compile(r"Content-ID: <([^>]+)>")
+REQUEST_LINE_RE = re.compile(r"GET (\S+) HTTP")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str = "application/json") -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        status, response = self.server.gmail._request(self.path)
+        self._send(status, json.dumps(response))
+
+    def do_POST(self):
+        # Batch request: a multipart body of GET requests, answered with a multipart body of responses
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        boundary = BOUNDARY_RE.search(self.headers["Content-Type"]).group(1)
+        paths = [
+            (CONTENT_ID_RE.search(part).group(1), REQUEST_LINE_RE.search(part).group(1))
+            for part in body.split(f"--{boundary}")[1:-1]
+        ]
+        responses = self.server.gmail._batch([path for _, path in paths])
+        parts = [
+            f"--batch\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\n\r\n"
+            f"{json.dumps(response)}\r\n"
+            for (content_id, _), (status, response) in zip(paths, responses)
+        ]
+        self._send(200, "".join(parts) + "--batch--", "multipart/mixed; boundary=batch")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, gmail: "FakeGmail"):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.gmail = gmail
+
+
+class FakeGmail:
+    """
+    Fake mailbox of one user, see the module docstring
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.history_id = 100
+        self._oldest_history_id = self.history_id
+        self._messages: dict[str, dict] = {}
+        self._history: list[dict] = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._server: _Server | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    def start(self) -> "FakeGmail":
+        self._server = _Server(self)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeGmail":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def service(self):
+        """
+        Returns a Gmail API client of the fake mailbox
+        """
+        service = build("gmail", "v1", credentials=Credentials("fake-token"), client_options={"api_endpoint": self.url})
+        # The batch endpoint is not derived from api_endpoint
+        service.new_batch_http_request = lambda callback=None: BatchHttpRequest(
+            callback=callback, batch_uri=f"{self.url}batch/gmail/v1"
+        )
+        return service
+
+    def _record(self, key: str, msg_id: str, **change) -> None:
+        self.history_id += 1
+        self._history.append({"id": str(self.history_id), key: [{"message": {"id": msg_id}, **change}]})
+
+    def add_message(self, subject: str | None = None, body: str | None = None, unread: bool = True) -> str:
+        """
+        Adds a message to the inbox, returns its id
+        """
+        with self._lock:
+            msg_id = f"m{self._next_id}"
+            self._next_id += 1
+            self._messages[msg_id] = {
+                "labels": ["INBOX", "UNREAD"] if unread else ["INBOX"],
+                "subject": subject or f"Subject {msg_id}",
+                "body": body or f"Body of {msg_id}",
+                "timestamp": 1_700_000_000 + self._next_id,
+            }
+            self._record("messagesAdded", msg_id)
+            return msg_id
+
+    def mark_read(self, msg_id: str) -> None:
+        with self._lock:
+            self._messages[msg_id]["labels"].remove("UNREAD")
+            self._record("labelsRemoved", msg_id, labelIds=["UNREAD"])
+
+    def delete_message(self, msg_id: str) -> None:
+        with self._lock:
+            del self._messages[msg_id]
+            self._record("messagesDeleted", msg_id)
+
+    def expire_history(self) -> None:
+        """
+        Forgets the history so far, listing it from any history id given until now then fails with 404
+        """
+        with self._lock:
+            self._oldest_history_id = self.history_id + 1
+            self._history.clear()
+
+    def _resource(self, msg_id: str, format: str, metadata_headers: list[str]) -> dict:
+        message = self._messages[msg_id]
+        headers = {
+            "From": f"sender-{msg_id}@example.com",
+            "To": "me@example.com",
+            "Subject": message["subject"],
+            "Date": format_datetime(datetime.fromtimestamp(message["timestamp"], timezone.utc)),
+        }
+        if format == "metadata" and metadata_headers:
+            headers = {name: value for name, value in headers.items() if name in metadata_headers}
+        payload = {"mimeType": "text/plain", "headers": [{"name": name, "value": value} for name, value in headers.items()]}
+        if format == "full":
+            payload["body"] = {"data": base64.urlsafe_b64encode(message["body"].encode()).decode()}
+        return {
+            "id": msg_id,
+            "threadId": f"t{msg_id}",
+            "labelIds": list(message["labels"]),
+            "snippet": message["body"][:100],
+            "internalDate": str(message["timestamp"] * 1000),
+            "payload": payload,
+        }
+
+    def _route(self, path: str) -> tuple[int, dict]:
+        url = urlsplit(path)
+        params = parse_qs(url.query)
+
+        if url.path.endswith("/users/me/profile"):
+            return 200, {"emailAddress": "me@example.com", "historyId": str(self.history_id)}
+
+        if url.path.endswith("/users/me/history"):
+            start = int(params["startHistoryId"][0])
+            if start < self._oldest_history_id:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            records = [record for record in self._history if int(record["id"]) > start]
+            return 200, {"history": records, "historyId": str(self.history_id)}
+
+        if url.path.endswith("/users/me/messages"):
+            label_ids = params.get("labelIds", [])
+            unread_only = "is:unread" in params.get("q", [""])[0]
+            msg_ids = [
+                msg_id for msg_id, message in self._messages.items()
+                if all(label in message["labels"] for label in label_ids)
+                and (not unread_only or "UNREAD" in message["labels"])
+            ]
+            msg_ids = msg_ids[::-1][:int(params.get("maxResults", [100])[0])]
+            return 200, {"messages": [{"id": msg_id, "threadId": f"t{msg_id}"} for msg_id in msg_ids]}
+
+        match = MESSAGE_PATH_RE.search(url.path)
+        if match is not None and match.group(1) in self._messages:
+            format = params.get("format", ["full"])[0]
+            return 200, self._resource(match.group(1), format, params.get("metadataHeaders", []))
+        return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+    def _request(self, path: str) -> tuple[int, dict]:
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            return self._route(path)
+
+    def _batch(self, paths: list[str]) -> list[tuple[int, dict]]:
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            return [self._route(path) for path in paths]
@@ -0,0 +1,214 @@
+"""
+Incremental Gmail sync into the email table.
+
+The first sync of a user imports the latest messages, later syncs only fetch the messages added, deleted or
+relabelled since the user's Gmail history cursor (gmail_sync.history_id), with users.history.list.
+Messages are upserted in bulk on (user_id, gmail_message_id), so syncing again never duplicates emails.
+"""
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from uuid import UUID
+
+from googleapiclient.errors import HttpError
+from pydantic import BaseModel
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import get_settings
+from app.schemas.app import Email, GmailSync, User
+from app.services.email_ingestion import ingest_emails
+from app.services.email import get_gmail_service, gmail_get_messages, gmail_list_messages, parse_message_body
+from app.utils import metrics
+
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+# Columns refreshed from Gmail when a stored message changed (not the summary or draft generated since)
+SYNCED_COLUMNS = ["gmail_thread_id", "from_sender", "email_subject", "email_status", "email_timestamp", "full_content"]
+
+
+class GmailChanges(BaseModel):
+    messages: list[dict]  # full message resources, added or changed
+    deleted_ids: list[str]
+    history_id: int
+    full_sync: bool
+
+
+def gmail_list_history(service, history_id: int, label_id: str) -> tuple[list[str], list[str], int]:
+    """
+    Lists the changes of the mailbox since `history_id`.
+    Returns the ids of the added or relabelled messages, the ids of the deleted ones, and the new history id.
+    Raises HttpError 404 if `history_id` is too old (Gmail keeps about a week of history).
+    """
+    changed = {}
+    deleted = set()
+    page_token = None
+    while True:
+        response = service.users().history().list(
+            userId="me",
+            startHistoryId=history_id,
+            labelId=label_id,
+            historyTypes=HISTORY_TYPES,
+            pageToken=page_token
+        ).execute()
+
+        for record in response.get("history", []):
+            for key in ("messagesAdded", "labelsAdded", "labelsRemoved"):
+                for change in record.get(key, []):
+                    changed[change["message"]["id"]] = True
+            for change in record.get("messagesDeleted", []):
+                deleted.add(change["message"]["id"])
+
+        page_token = response.get("nextPageToken")
+        if page_token is None:
+            changed_ids = [msg_id for msg_id in changed if msg_id not in deleted]
+            return changed_ids, sorted(deleted), int(response["historyId"])
+
+
+def gmail_fetch_changes(user: User, history_id: int | None, label_id: str = "INBOX", query: str | None = None) -> GmailChanges:
+    """
+    Fetches the messages changed since `history_id`, or the latest ones if None (or expired)
+    """
+    service = get_gmail_service(user)
+
+    if history_id is not None:
+        try:
+            changed_ids, deleted_ids, new_history_id = gmail_list_history(service, history_id, label_id)
+            fetched = gmail_get_messages(service, changed_ids, format="full")
+            return GmailChanges(
+                messages=[fetched[msg_id] for msg_id in changed_ids if msg_id in fetched],
+                deleted_ids=deleted_ids,
+                history_id=new_history_id,
+                full_sync=False
+            )
+        except HttpError as error:
+            if error.status_code != 404:
+                raise
+
+    # Read the cursor first, so the messages arriving while listing are picked up by the next sync
+    new_history_id = int(service.users().getProfile(userId="me").execute()["historyId"])
+    msgs = gmail_list_messages(
+        service,
+        label_ids=[label_id],
+        query=query,
+        max_results=get_settings().gmail_sync_max_messages
+    )
+    fetched = gmail_get_messages(service, [m["id"] for m in msgs], format="full")
+    return GmailChanges(
+        messages=[fetched[m["id"]] for m in msgs if m["id"] in fetched],
+        deleted_ids=[],
+        history_id=new_history_id,
+        full_sync=True
+    )
+
+
+def _parse_timestamp(message: dict, headers: dict) -> datetime | None:
+    if "internalDate" in message:
+        return datetime.fromtimestamp(int(message["internalDate"]) / 1000, tz=timezone.utc)
+    try:
+        return parsedate_to_datetime(headers["Date"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def to_email_row(user_id: UUID, message: dict) -> dict:
+    """
+    Maps a full Gmail message resource to the columns of the email table
+    """
+    headers = {h.get("name"): h.get("value") for h in message.get("payload", {}).get("headers", [])}
+    return {
+        "user_id": user_id,
+        "gmail_message_id": message["id"],
+        "gmail_thread_id": message.get("threadId"),
+        "from_sender": headers.get("From"),
+        "email_subject": headers.get("Subject"),
+        "email_status": "unread" if "UNREAD" in message.get("labelIds", []) else "read",
+        "email_timestamp": _parse_timestamp(message, headers),
+        "full_content": parse_message_body(message)["text"],
+    }
+
+
+async def save_history_id(session: AsyncSession, user_id: UUID, history_id: int) -> None:
+    statement = insert(GmailSync).values(user_id=user_id, history_id=history_id, synced_at=datetime.now(timezone.utc))
+    # Never move the cursor back, if two syncs of the same user overlap
+    await session.exec(statement.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            "history_id": func.greatest(GmailSync.history_id, statement.excluded.history_id),
+            "synced_at": statement.excluded.synced_at,
+        }
+    ))
+
+
+async def lock_user_sync(session: AsyncSession, user_id: UUID, wait: bool = True) -> bool:
+    """
+    Locks the user's sync until the end of the session's transaction, across all the app processes.
+    Without `wait`, returns False right away if another sync holds the lock.
+    """
+    key = func.hashtext(f"gmail_sync:{user_id}")
+    if wait:
+        await session.exec(select(func.pg_advisory_xact_lock(key)))
+        return True
+    return (await session.exec(select(func.pg_try_advisory_xact_lock(key)))).one()
+
+
+async def _read_history_id(session: AsyncSession, user_id: UUID) -> int | None:
+    return (await session.exec(select(GmailSync.history_id).where(GmailSync.user_id == user_id))).first()
+
+
+async def sync_gmail_inbox(
+    session: AsyncSession,
+    user: User,
+    label_id: str = "INBOX",
+    query: str | None = None,
+    wait: bool = True
+) -> list[Email] | None:
+    """
+    Syncs the user's Gmail messages into the email table, in one transaction with the new cursor.
+    `query` only filters the first (full) sync. Returns the emails added or changed.
+    One sync writes per user at a time, without `wait` returns None if the user is being synced already.
+    """
+    # No transaction (nor connection) is held during the Gmail calls: the cursor is read in a short one,
+    # and the changes are written in another one, under the user's lock, if the cursor didn't move meanwhile
+    history_id = await _read_history_id(session, user.user_id)
+    await session.commit()
+
+    while True:
+        # The Gmail client is sync, keep it off the event loop
+        changes = await asyncio.to_thread(gmail_fetch_changes, user, history_id, label_id, query)
+
+        if not await lock_user_sync(session, user.user_id, wait):
+            await session.rollback()
+            return None
+
+        current_history_id = await _read_history_id(session, user.user_id)
+        if current_history_id == history_id:
+            break
+        # Another sync wrote newer changes meanwhile, these may be stale
+        await session.rollback()
+        metrics.increment("gmail_sync.superseded")
+        if not wait:
+            return None
+        history_id = current_history_id
+
+    emails = await ingest_emails(
+        session,
+        [to_email_row(user.user_id, message) for message in changes.messages],
+        update_columns=SYNCED_COLUMNS,
+        commit=False
+    )
+    if changes.deleted_ids:
+        # Deleted emails are kept, their tasks reference them
+        await session.exec(
+            update(Email)
+            .where(Email.user_id == user.user_id, Email.gmail_message_id.in_(changes.deleted_ids))
+            .values(email_status="deleted")
+        )
+    await save_history_id(session, user.user_id, changes.history_id)
+    await session.commit()
+
+    metrics.increment(f"gmail_sync.{'full' if changes.full_sync else 'incremental'}")
+    metrics.increment("gmail_sync.messages", len(changes.messages))
+    return emails
@@ -0,0 +1,166 @@
+"""
+Background Gmail sync of every connected user (with a refresh token), started in the app lifespan.
+
+Each user is synced every INBOX_SYNC_INTERVAL seconds, with some jitter so the users don't all sync at once.
+Due users are queued and synced by INBOX_SYNC_WORKERS workers, one sync per user at a time, at most
+INBOX_SYNC_RATE syncs started per second (Google API quotas). A failing user is retried with an exponential
+backoff, up to INBOX_SYNC_MAX_BACKOFF seconds.
+"""
+import asyncio
+import logging
+import random
+import time
+from uuid import UUID
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import get_settings
+from app.db.connection import get_async_engine
+from app.schemas.app import User
+from app.services.gmail_sync import sync_gmail_inbox
+from app.utils import metrics
+from app.utils.rate_limit import TokenBucket
+import app.services.users as users
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two checks for due users
+TICK = 1
+# Seconds between two reloads of the connected users
+USERS_REFRESH = 60
+
+
+class InboxSyncScheduler:
+    """
+    Periodically syncs the inbox of every connected user, see the module docstring
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.interval = settings.inbox_sync_interval
+        self.jitter = settings.inbox_sync_jitter
+        self.max_backoff = settings.inbox_sync_max_backoff
+        self.workers = settings.inbox_sync_workers
+
+        self._rate_limiter = TokenBucket(settings.inbox_sync_rate, capacity=max(1.0, settings.inbox_sync_rate))
+        self._queue: asyncio.Queue[UUID] = asyncio.Queue()
+        # Next sync of each connected user (monotonic time)
+        self._due: dict[UUID, float] = {}
+        self._failures: dict[UUID, int] = {}
+        # Users queued or being synced, never queued twice
+        self._pending: set[UUID] = set()
+        self._running = 0
+        self._lag = 0.0
+        self._tasks: list[asyncio.Task] = []
+
+        metrics.register_gauge("inbox_sync", self.stats)
+
+    def _next_run(self, delay: float) -> float:
+        return time.monotonic() + delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._schedule())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def request_sync(self, user_id: UUID) -> bool:
+        """
+        Syncs the user as soon as possible (eg: the user asked for the latest emails).
+        Returns False, without queuing anything, if the scheduler is not running (eg: INBOX_SYNC_ENABLED off).
+        """
+        if not self.running:
+            return False
+        self._due[user_id] = time.monotonic()
+        self._enqueue(user_id)
+        return True
+
+    def _enqueue(self, user_id: UUID) -> None:
+        if user_id not in self._pending:
+            self._pending.add(user_id)
+            self._queue.put_nowait(user_id)
+
+    async def _load_users(self) -> None:
+        async with AsyncSession(get_async_engine()) as session:
+            user_ids = set((await session.exec(
+                select(User.user_id).where(User.refresh_token.is_not(None))
+            )).all())
+
+        for user_id in user_ids - self._due.keys():
+            # Spread the first syncs over an interval
+            self._due[user_id] = time.monotonic() + random.uniform(0, self.interval)
+        for user_id in self._due.keys() - user_ids:
+            del self._due[user_id]
+            self._failures.pop(user_id, None)
+
+    async def _schedule(self) -> None:
+        loaded_at = None
+        while True:
+            if loaded_at is None or time.monotonic() - loaded_at > USERS_REFRESH:
+                try:
+                    await self._load_users()
+                    loaded_at = time.monotonic()
+                except Exception as error:
+                    logger.warning(f"Could not load the users to sync: {error}")
+
+            now = time.monotonic()
+            for user_id, due in list(self._due.items()):
+                if due <= now:
+                    self._enqueue(user_id)
+            await asyncio.sleep(TICK)
+
+    async def _work(self) -> None:
+        while True:
+            user_id = await self._queue.get()
+            try:
+                await self._rate_limiter.acquire()
+                self._lag = max(0.0, time.monotonic() - self._due.get(user_id, time.monotonic()))
+                self._running += 1
+                try:
+                    await self._sync(user_id)
+                finally:
+                    self._running -= 1
+
+                self._failures.pop(user_id, None)
+                delay = self.interval
+                metrics.increment("inbox_sync.synced")
+            except Exception as error:
+                failures = self._failures[user_id] = self._failures.get(user_id, 0) + 1
+                delay = min(self.interval * 2 ** failures, self.max_backoff)
+                metrics.increment("inbox_sync.failed")
+                logger.warning(f"Inbox sync of user {user_id} failed ({failures} in a row): {error}")
+            finally:
+                self._pending.discard(user_id)
+                self._queue.task_done()
+
+            if user_id in self._due:
+                self._due[user_id] = self._next_run(delay)
+
+    async def _sync(self, user_id: UUID) -> None:
+        async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+            user = await users.find_by_id(session, user_id)
+            if user is None or user.refresh_token is None:
+                return
+            # Another worker process may be syncing the user already, skip it until the next run then
+            await sync_gmail_inbox(session, user, wait=False)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        overdue = [now - due for due in self._due.values() if due <= now]
+        return {
+            "users": len(self._due),
+            "queue_depth": self._queue.qsize(),
+            "running": self._running,
+            "failing_users": len(self._failures),
+            "last_lag_seconds": self._lag,
+            "max_overdue_seconds": max(overdue, default=0.0),
+        }
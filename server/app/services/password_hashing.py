@@ -0,0 +1,137 @@
+"""
+Password hashing off the event loop.
+
+argon2 (see policy.ini) takes tens of milliseconds of CPU and 64 MiB of memory per hash, so the hashes run
+in a small dedicated thread pool (argon2-cffi releases the GIL) of PASSWORD_HASH_WORKERS threads.
+At most PASSWORD_HASH_QUEUE_SIZE more hashes wait for a thread, past that PasswordHashingBusy is raised
+(503), so a login burst queues up to a bounded delay instead of exhausting the memory.
+
+Login throughput benchmark (verifications/s, latency, and the event loop lag meanwhile):
+
+    python -m app.services.password_hashing benchmark [<concurrency>] [<logins>]
+"""
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Callable
+
+import numpy as np
+from passlib.context import CryptContext
+
+from app.config import get_settings
+from app.utils import metrics
+
+
+pwd_context = CryptContext()
+pwd_context.load_path("app/policy.ini")
+
+# Hashes running or waiting for a thread, only updated from the event loop
+_pending = 0
+
+
+class PasswordHashingBusy(Exception):
+    """
+    Raised when too many hashes are already pending
+    """
+
+
+@cache
+def get_hashing_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=get_settings().password_hash_workers,
+        thread_name_prefix="password-hashing"
+    )
+
+
+async def run_hashing(fn: Callable, *args):
+    """
+    Runs `fn` (a pwd_context method) in the hashing executor, unless too many hashes are pending
+    """
+    global _pending
+    settings = get_settings()
+    if _pending >= settings.password_hash_workers + settings.password_hash_queue_size:
+        metrics.increment("password_hashing.rejected")
+        raise PasswordHashingBusy()
+
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_hashing_executor(), fn, *args)
+    finally:
+        _pending -= 1
+        metrics.increment("password_hashing.hashes")
+
+
+metrics.register_gauge("password_hashing.pending", lambda: _pending)
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hash the password with the default scheme of policy.ini (argon2)
+    """
+    return await run_hashing(pwd_context.hash, password)
+
+
+async def verify_password(plain: str, hashed: str) -> tuple[bool, str | None]:
+    """
+    Verify the plain password matches the hashed one.
+    Also returns the new hash to store if `hashed` uses a deprecated scheme (eg: pbkdf2_sha256) or
+    outdated argon2 parameters, None otherwise.
+    """
+    return await run_hashing(pwd_context.verify_and_update, plain, hashed)
+
+
+async def benchmark(concurrency: int, logins: int) -> dict:
+    """
+    Verifies `logins` passwords, `concurrency` at a time, while measuring the event loop lag
+    """
+    hashed = await hash_password("benchmark-password")
+    latencies = []
+    lags = []
+    done = asyncio.Event()
+
+    async def login():
+        start = time.perf_counter()
+        await verify_password("benchmark-password", hashed)
+        latencies.append(time.perf_counter() - start)
+
+    async def worker(count: int):
+        for _ in range(count):
+            await login()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        worker(logins // concurrency + (i < logins % concurrency)) for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker_task
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "logins": logins,
+        "concurrency": concurrency,
+        "workers": get_settings().password_hash_workers,
+        "logins_per_second": logins / elapsed,
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)),
+        "latency_ms_p99": float(np.percentile(latencies_ms, 99)),
+        "event_loop_lag_ms_max": max(lags) * 1000 if lags else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    command, *args = sys.argv[1:]
+    if command == "benchmark":
+        concurrency, logins = (int(arg) for arg in (args + ["8", "64"][len(args):]))
+        print(json.dumps(asyncio.run(benchmark(concurrency, logins)), indent=2))
+    else:
+        raise SystemExit(f"Unknown command: {command}")
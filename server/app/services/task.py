@@ -1,11 +1,12 @@
-from sqlmodel import select, Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.schemas.app import User, Task, Email
 
 
-def get_tasks_by_user(user: User, session: Session) -> list[Task]:
-    all_tasks = session.exec(
+async def get_tasks_by_user(user: User, session: AsyncSession) -> list[Task]:
+    all_tasks = (await session.exec(
         select(Task)
             .join(Email, Task.email_id == Email.email_id)
             .where(Email.user_id == user.user_id)
-    ).all()
-    return all_tasks
\ No newline at end of file
+    )).all()
+    return all_tasks
@@ -1,23 +1,78 @@
 import uuid
+from functools import cache
 
-from sqlmodel import select, Session
+from sqlmodel import select
 
-from app.db.connection import SessionDep
+from app.config import get_settings
+from app.db.connection import AsyncSessionDep
 from app.schemas.app import (
     User
 )
+from app.utils.cache import TTLCache
 
 
-def find_one(session: SessionDep, email: str) -> User | None:
+@cache
+def get_principal_cache() -> TTLCache:
+    """
+    Users by email, as authenticated by get_current_user.
+    Invalidated when this module updates a user, the TTL bounds how stale the other workers' copies get.
+    """
+    settings = get_settings()
+    return TTLCache(settings.principal_cache_size, settings.principal_cache_ttl, name="principal_cache")
+
+
+async def find_authenticated(session: AsyncSessionDep, email: str) -> User | None:
+    """
+    Finds a user by email, from the principal cache if possible
+    """
+    principals = get_principal_cache()
+    user = principals.get(email)
+    if user is None:
+        user = await find_one(session, email)
+        if user is not None:
+            principals.set(email, user)
+    return user
+
+
+async def find_one(session: AsyncSessionDep, email: str) -> User | None:
     """
     Finds a user by email
     """
-    return session.exec(select(User).where(User.email == email)).first()
+    return (await session.exec(select(User).where(User.email == email))).first()
+
+
+async def find_by_id(session: AsyncSessionDep, user_id: uuid.UUID) -> User | None:
+    """
+    Finds a user by id
+    """
+    return await session.get(User, user_id)
 
 
-def add_one(session: SessionDep, user: User):
+async def add_one(session: AsyncSessionDep, user: User):
     """
     Adds a user to the database
     """
     session.add(user)
-    session.commit()
+    await session.commit()
+    get_principal_cache().invalidate(user.email)
+
+
+async def update_password_hash(session: AsyncSessionDep, user: User, saltpassword: str):
+    """
+    Replaces the password hash of a user (eg: rehashed with the current scheme)
+    """
+    user.saltpassword = saltpassword
+    session.add(user)
+    await session.commit()
+    get_principal_cache().invalidate(user.email)
+
+
+async def update_google_tokens(session: AsyncSessionDep, user: User, access_token: str, refresh_token: str):
+    """
+    Stores the Google OAuth tokens of a user
+    """
+    user.access_token = access_token
+    user.refresh_token = refresh_token
+    session.add(user)
+    await session.commit()
+    get_principal_cache().invalidate(user.email)
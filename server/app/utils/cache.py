@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+
+from app.utils import metrics
+
+
+class TTLCache:
+    """
+    In-process LRU cache, whose entries also expire `ttl` seconds after being set.
+    With a `name`, its hit rate and size are reported in the metrics as `name`.hit_rate and `name`.size.
+    """
+
+    def __init__(self, max_size: int, ttl: float, name: str | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+        if name is not None:
+            metrics.register_rate(f"{name}.hit_rate", f"{name}.hit", f"{name}.miss")
+            metrics.register_gauge(f"{name}.size", self.__len__)
+
+    def _record(self, hit: bool) -> None:
+        if self.name is not None:
+            metrics.increment(f"{self.name}.{'hit' if hit else 'miss'}")
+
+    def get(self, key: Hashable, default=None):
+        """
+        Returns the value of `key`, `default` if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        self._record(entry is not None)
+        return default if entry is None else entry[1]
+
+    def set(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,29 @@
+import functools
+import inspect
+from contextvars import ContextVar
+
+
+def context_decorator(var: ContextVar, value):
+    """
+    Decorator setting `var` to `value` during the calls of the (sync or async) function
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                token = var.set(value)
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    var.reset(token)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = var.set(value)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                var.reset(token)
+        return wrapper
+    return decorator
@@ -0,0 +1,89 @@
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from typing import Any, Callable
+
+# Simple in-process metrics, shared across the services and exposed through GET /metrics.
+# Each uvicorn worker keeps its own values.
+
+_lock = Lock()
+_counters: dict[str, float] = defaultdict(float)
+_rates: dict[str, tuple[str, str]] = {}
+_gauges: dict[str, Callable[[], Any]] = {}
+# Count of the observations per bucket (the last one above the largest bound), and their sum
+_histograms: dict[str, tuple[list[int], list[float]]] = {}
+
+# Upper bounds of the histogram buckets, in seconds
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def increment(name: str, value: float = 1) -> None:
+    """
+    Increment the counter `name` by `value`
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def get_counter(name: str) -> float:
+    """
+    Returns the current value of the counter `name`
+    """
+    return _counters.get(name, 0)
+
+
+def hit_rate(hits: str, misses: str) -> float | None:
+    """
+    Returns the ratio of the `hits` counter over `hits` + `misses`, None if neither was recorded
+    """
+    total = get_counter(hits) + get_counter(misses)
+    return get_counter(hits) / total if total else None
+
+
+def register_rate(name: str, hits: str, misses: str) -> None:
+    """
+    Report the hit_rate of the `hits` and `misses` counters as `name` in the snapshot
+    """
+    _rates[name] = (hits, misses)
+
+
+def register_gauge(name: str, read: Callable[[], Any]) -> None:
+    """
+    Report the value returned by `read` as `name` in the snapshot (eg: connection pool utilisation)
+    """
+    _gauges[name] = read
+
+
+def observe(name: str, value: float) -> None:
+    """
+    Record `value` in the histogram `name` (eg: a duration in seconds)
+    """
+    with _lock:
+        counts, total = _histograms.setdefault(name, ([0] * (len(HISTOGRAM_BUCKETS) + 1), [0.0]))
+        counts[bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+        total[0] += value
+
+
+def _histogram_snapshot(counts: list[int], total: float) -> dict:
+    buckets = {}
+    cumulative = 0
+    for bound, count in zip(HISTOGRAM_BUCKETS, counts):
+        cumulative += count
+        buckets[str(bound)] = cumulative
+    buckets["+Inf"] = cumulative + counts[-1]
+    return {"count": buckets["+Inf"], "sum": total, "buckets": buckets}
+
+
+def snapshot() -> dict:
+    """
+    Returns a copy of all the metrics
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {name: _histogram_snapshot(counts, total[0]) for name, (counts, total) in _histograms.items()}
+    return {
+        "counters": counters,
+        "histograms": histograms,
+        "rates": {name: hit_rate(hits, misses) for name, (hits, misses) in _rates.items()},
+        "gauges": {name: read() for name, read in _gauges.items()},
+    }
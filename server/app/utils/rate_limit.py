@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, in bursts of up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """
+        Returns the seconds until `tokens` are available, 0 if they are now
+        """
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def consume(self, tokens: float) -> None:
+        """
+        Takes `tokens` even if not available, or gives them back if negative
+        (eg: a cost only known once the request is done)
+        """
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - tokens)
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """
+        Waits until `tokens` are available, and takes them
+        """
+        while not self.try_acquire(tokens):
+            await asyncio.sleep((tokens - self._tokens) / self.rate)
@@ -0,0 +1,44 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from app.utils import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces the concurrent calls with the same key: only the first one runs, the others await its result
+    (or exception). With a `name`, the share of calls coalesced is reported in the metrics as `name`.coalesced_rate.
+    """
+
+    def __init__(self, name: str | None = None):
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+        if name is not None:
+            metrics.register_rate(f"{name}.coalesced_rate", f"{name}.coalesced", f"{name}.calls")
+            metrics.register_gauge(f"{name}.in_flight", self.__len__)
+
+    def _record(self, coalesced: bool) -> None:
+        if self.name is not None:
+            metrics.increment(f"{self.name}.{'coalesced' if coalesced else 'calls'}")
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Returns the result of `fn()`, shared with the calls with the same `key` made until it completes
+        """
+        future = self._calls.get(key)
+        self._record(coalesced=future is not None)
+        if future is None:
+            # A task, so that a caller cancelled (eg: client disconnected) doesn't cancel the call of the others
+            future = self._calls[key] = asyncio.ensure_future(fn())
+            future.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,43 @@
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+@pytest_asyncio.fixture(scope="session")
+async def db():
+    """
+    Opens the shared connection pool and returns the async app engine, the test is skipped without a database
+    """
+    from app.db.connection import dispose_engines, get_async_engine
+    from app.db.pool import get_connection_pool
+
+    pool = get_connection_pool()
+    try:
+        await pool.open(wait=True, timeout=5)
+    except Exception as error:
+        pytest.skip(f"No database: {error}")
+    yield get_async_engine()
+    await dispose_engines()
+    await pool.close()
+
+
+@pytest_asyncio.fixture
+async def user(db):
+    """
+    Adds a user, deleted with its emails and Gmail sync cursor after the test
+    """
+    from app.schemas.app import Email, GmailSync, User
+
+    user = User(email=f"test-{uuid4()}@example.com", name="Test", saltpassword=f"hash-{uuid4()}")
+    async with AsyncSession(db, expire_on_commit=False) as session:
+        session.add(user)
+        await session.commit()
+    yield user
+    async with AsyncSession(db) as session:
+        for model in (Email, GmailSync):
+            await session.exec(delete(model).where(model.user_id == user.user_id))
+        await session.exec(delete(User).where(User.user_id == user.user_id))
+        await session.commit()
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+from langchain_core.runnables import RunnableLambda
+
+from app.services.chatbot.helper_functions import (
+    aextract_email_info,
+    aextract_invoice_info,
+    aextract_meeting_info,
+    aextract_user_intent,
+)
+
+# Seconds taken by each structured call of the model
+DELAY = 0.2
+
+
+class SlowModel:
+    """
+    Chat model stand-in, its structured calls take DELAY seconds without blocking the event loop
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        async def call(prompt):
+            self.calls += 1
+            await asyncio.sleep(DELAY)
+            return schema.model_construct(**dict.fromkeys(schema.model_fields))
+
+        return RunnableLambda(lambda prompt: None, afunc=call)
+
+
+async def test_concurrent_turns_do_not_wait_for_each_other():
+    model = SlowModel()
+    turns = [
+        extract(model, f"message {i} of the turn")
+        for i in range(5)
+        for extract in (aextract_user_intent, aextract_invoice_info, aextract_meeting_info, aextract_email_info)
+    ]
+
+    start = time.perf_counter()
+    await asyncio.gather(*turns)
+    elapsed = time.perf_counter() - start
+
+    assert model.calls == len(turns)
+    # Run one after the other, they would take len(turns) * DELAY
+    assert elapsed < 3 * DELAY
+
+
+async def test_identical_concurrent_calls_are_made_once():
+    model = SlowModel()
+    await asyncio.gather(*[aextract_user_intent(model, "send an email to bob") for _ in range(5)])
+    assert model.calls == 1
@@ -0,0 +1,55 @@
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+from app.db.pool import get_connection_pool
+from app.services.chatbot.graph import GraphRegistry
+
+
+class CannedModel:
+    """
+    Chat model stand-in: no intent is recognised, and every reply is the same
+    """
+
+    async def ainvoke(self, prompt, config=None):
+        return AIMessage(content="I can help with invoices, emails and meetings.")
+
+    def with_structured_output(self, schema):
+        return RunnableLambda(lambda prompt: schema.model_construct(**dict.fromkeys(schema.model_fields)))
+
+
+async def test_checkpoint_keeps_the_user_id_only(db, user):
+    user.access_token, user.refresh_token = f"access-{uuid4()}", f"refresh-{uuid4()}"
+    checkpointer = AsyncPostgresSaver(conn=get_connection_pool())
+    await checkpointer.setup()
+    registry = GraphRegistry(checkpointer, model=CannedModel())
+    thread_id = f"test-{uuid4()}"
+    config = registry.get_config(thread_id, user)
+
+    try:
+        # The turn stops at the interrupt waiting for the user's reply
+        await registry.graph.ainvoke({"user_id": user.user_id, "messages": [{"role": "user", "content": "hello"}]}, config)
+
+        state = await registry.graph.aget_state(config)
+        assert state.values["user_id"] == user.user_id
+        assert "user" not in state.values
+
+        async with get_connection_pool().connection() as conn:
+            stored = b""
+            for table, columns in (
+                ("checkpoints", "checkpoint::text || metadata::text"),
+                ("checkpoint_blobs", "coalesce(blob, '')"),
+                ("checkpoint_writes", "blob"),
+            ):
+                rows = await (await conn.execute(f"SELECT {columns} FROM {table} WHERE thread_id = %s", (thread_id,))).fetchall()
+                stored += b"".join(value.encode() if isinstance(value, str) else bytes(value) for value, in rows)
+        assert stored
+        # Serialised as its hex
+        assert user.user_id.hex.encode() in stored
+        for secret in (user.saltpassword, user.access_token, user.refresh_token, user.email):
+            assert secret.encode() not in stored
+        assert b"app.schemas.app" not in stored
+    finally:
+        await checkpointer.adelete_thread(thread_id)
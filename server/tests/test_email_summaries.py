@@ -0,0 +1,38 @@
+import pytest
+from langchain_core.runnables import RunnableLambda
+from sqlalchemy import delete
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import get_settings
+from app.schemas.app import Email, EmailSummary
+from app.services import email_summaries
+from app.services.chatbot.email import Summary
+
+
+@pytest.fixture
+def summariser(monkeypatch):
+    """
+    Summarises without the LLM, by the first words of the email
+    """
+    async def summarise(prompt):
+        return Summary(summary=f"Summary of {prompt.to_messages()[-1].content[:20]}")
+
+    monkeypatch.setattr(email_summaries, "get_structured_llm", lambda model, schema: RunnableLambda(summarise))
+    monkeypatch.setattr(email_summaries, "get_chatbot", lambda: None)
+    monkeypatch.setattr(get_settings(), "summary_batch_size", 10)
+
+
+async def test_bounded_runs_summarise_one_batch_each(db, user, summariser):
+    async with AsyncSession(db) as session:
+        session.add_all(Email(user_id=user.user_id, full_content=f"Email {user.user_id} {i}") for i in range(25))
+        await session.commit()
+
+    runs = [await email_summaries.summarise_pending_emails(user.user_id, max_batches=1) for _ in range(3)]
+    assert [(run["summarised"], run["pending"]) for run in runs] == [(10, True), (10, True), (5, False)]
+
+    async with AsyncSession(db) as session:
+        summaries = (await session.exec(select(Email.summary).where(Email.user_id == user.user_id))).all()
+        await session.exec(delete(EmailSummary).where(EmailSummary.summary.in_(summaries)))
+        await session.commit()
+    assert all(summaries)
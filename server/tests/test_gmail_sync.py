@@ -0,0 +1,64 @@
+import pytest
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.schemas.app import Email, GmailSync
+from app.services import gmail_sync
+from app.services.fake_gmail import FakeGmail
+
+
+@pytest.fixture
+def gmail(monkeypatch):
+    with FakeGmail() as gmail:
+        monkeypatch.setattr(gmail_sync, "get_gmail_service", lambda user: gmail.service())
+        yield gmail
+
+
+async def sync(db, user) -> tuple[list[str], dict[str, str], int]:
+    """
+    Syncs the user's inbox, returns the ids of the emails synced, the stored statuses by id and the cursor
+    """
+    async with AsyncSession(db, expire_on_commit=False) as session:
+        emails = await gmail_sync.sync_gmail_inbox(session, user)
+        stored = (await session.exec(select(Email).where(Email.user_id == user.user_id))).all()
+        cursor = await session.get(GmailSync, user.user_id)
+        return (
+            sorted(email.gmail_message_id for email in emails),
+            {email.gmail_message_id: email.email_status for email in stored},
+            cursor.history_id
+        )
+
+
+async def test_sync_follows_the_history_cursor(db, user, gmail):
+    first, second, third = [gmail.add_message() for _ in range(3)]
+
+    synced, statuses, cursor = await sync(db, user)
+    assert synced == sorted([first, second, third])
+    assert cursor == gmail.history_id
+
+    # Nothing changed since the cursor
+    synced, _, cursor = await sync(db, user)
+    assert synced == []
+    assert cursor == gmail.history_id
+
+    fourth = gmail.add_message()
+    gmail.mark_read(first)
+    gmail.delete_message(second)
+    synced, statuses, cursor = await sync(db, user)
+    assert synced == sorted([first, fourth])
+    assert statuses == {first: "read", second: "deleted", third: "unread", fourth: "unread"}
+    assert cursor == gmail.history_id
+
+
+async def test_expired_cursor_falls_back_to_a_full_sync(db, user, gmail):
+    first, second = gmail.add_message(), gmail.add_message()
+    await sync(db, user)
+
+    gmail.mark_read(first)
+    gmail.expire_history()
+    third = gmail.add_message()
+    synced, statuses, cursor = await sync(db, user)
+    # The latest messages are imported again, not only the changes since the cursor
+    assert synced == sorted([first, second, third])
+    assert statuses == {first: "read", second: "unread", third: "unread"}
+    assert cursor == gmail.history_id
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.schemas.app import LLMCacheEntry
+from app.services.chatbot.llm_cache import LLMResponseCache, _hash, cache_template
+
+
+@cache_template("intent")
+async def lookup(cache: LLMResponseCache, prompt: str, llm_string: str):
+    return await cache.alookup(prompt, llm_string)
+
+
+@cache_template("intent")
+async def update(cache: LLMResponseCache, prompt: str, llm_string: str, generations: list):
+    await cache.aupdate(prompt, llm_string, generations)
+
+
+async def test_cached_response_round_trip(db):
+    prompt, llm_string = f"prompt-{uuid4()}", "llm"
+    await update(LLMResponseCache(), prompt, llm_string, [ChatGeneration(message=AIMessage(content="sendEmail"))])
+
+    # Read from the database by a fresh cache, without the in-process tier
+    generations = await lookup(LLMResponseCache(), prompt, llm_string)
+    assert generations[0].message.content == "sendEmail"
+
+    async with AsyncSession(db) as session:
+        await session.delete(await session.get(LLMCacheEntry, _hash(llm_string, prompt)))
+        await session.commit()
+
+
+async def test_unreadable_response_is_a_miss_and_deleted(db):
+    prompt, llm_string = f"prompt-{uuid4()}", "llm"
+    key = _hash(llm_string, prompt)
+    now = datetime.now(timezone.utc)
+    async with AsyncSession(db) as session:
+        session.add(LLMCacheEntry(
+            cache_key=key, template="intent", llm_hash=_hash(llm_string), response='[{"lc": 1, "type": "constructor"',
+            tokens=10, created_at=now, expires_at=now + timedelta(hours=1)
+        ))
+        await session.commit()
+
+    assert await lookup(LLMResponseCache(), prompt, llm_string) is None
+
+    async with AsyncSession(db) as session:
+        assert await session.get(LLMCacheEntry, key) is None
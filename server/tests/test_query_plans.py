@@ -0,0 +1,198 @@
+"""
+Query plans of the app's lookups on a synthetic dataset of 1M emails, tasks, summaries and LLM cache entries:
+each uses the index of migrations 001 to 004 made for it. The dataset is rolled back after the tests.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+import numpy as np
+import pytest_asyncio
+from pgvector.psycopg import register_vector_async
+from sqlalchemy import delete, text
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.schemas.app import Email, EmailSummary, GmailSync, Invoice, LLMCacheEntry, Task, User
+
+ROWS = 1_000_000
+USERS = 1000
+# LLM cache entries with a prompt embedding (semantic templates)
+EMBEDDINGS = 2000
+
+SEED = [
+    f"""
+    INSERT INTO app_user (user_id, email, name, saltpassword, created_at)
+    SELECT md5('user' || i)::uuid, 'plan-' || i || '@example.com', 'User ' || i, 'x', now()
+    FROM generate_series(1, {USERS}) i
+    """,
+    f"""
+    INSERT INTO email (email_id, user_id, gmail_message_id, email_status, email_timestamp, full_content, summary,
+                       content_hash)
+    SELECT md5('email' || i)::uuid, md5('user' || (i % {USERS} + 1))::uuid, 'g' || i, 'read',
+           now() - i * interval '1 minute', 'Body ' || i, CASE WHEN i % 100 <> 0 THEN 'Summary' END, md5('body' || i)
+    FROM generate_series(1, {ROWS}) i
+    """,
+    f"""
+    INSERT INTO task (task_id, title, email_id, created_at)
+    SELECT md5('task' || i)::uuid, 'Task ' || i, md5('email' || i)::uuid, now()
+    FROM generate_series(1, {ROWS}) i
+    """,
+    f"""
+    INSERT INTO invoice (invoice_id, creator_id, full_name, item_cost)
+    SELECT md5('invoice' || i)::uuid, md5('user' || (i % {USERS} + 1))::uuid, 'Client ' || i, i
+    FROM generate_series(1, {ROWS // 10}) i
+    """,
+    f"""
+    INSERT INTO gmail_sync (user_id, history_id, synced_at)
+    SELECT md5('user' || i)::uuid, i, now()
+    FROM generate_series(1, {USERS}) i
+    """,
+    f"""
+    INSERT INTO email_summary (content_hash, summary)
+    SELECT md5('body' || i), 'Summary'
+    FROM generate_series(1, {ROWS}) i
+    """,
+    f"""
+    INSERT INTO llm_cache (cache_key, template, llm_hash, response, tokens, expires_at)
+    SELECT md5('prompt' || i), 'intent', 'llm', '[]', 10, now() + (i % 1000 - 1) * interval '1 second'
+    FROM generate_series(1, {ROWS - EMBEDDINGS}) i
+    """,
+    f"""
+    INSERT INTO llm_cache (cache_key, template, llm_hash, response, tokens, embedding, expires_at)
+    SELECT md5('semantic' || i), 'intent', 'llm', '[]', 10, embedding, now() + interval '1 day'
+    FROM generate_series(1, {EMBEDDINGS}) i,
+         LATERAL (SELECT array_agg(random())::vector AS embedding FROM generate_series(1, 1024) WHERE i > 0) random
+    """,
+    "ANALYZE app_user, email, task, invoice, gmail_sync, email_summary, llm_cache",
+]
+
+USER_ID = UUID(hashlib.md5(b"user1").hexdigest())  # a seeded user, as md5('user1')::uuid
+NOW = datetime.now(timezone.utc)
+
+
+@pytest_asyncio.fixture(scope="module")
+async def explain(db):
+    """
+    Seeds the dataset in a transaction, and returns a function returning the plan of a statement
+    """
+    async with AsyncSession(db) as session:
+        for statement in SEED:
+            await session.exec(text(statement))
+        connection = (await (await session.connection()).get_raw_connection()).driver_connection
+        await register_vector_async(connection)
+        cursor = connection.cursor()
+
+        async def explain(statement) -> dict:
+            compiled = statement.compile(
+                dialect=postgresql.psycopg.dialect(), compile_kwargs={"render_postcompile": True}
+            )
+            await cursor.execute(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+            return (await cursor.fetchone())[0][0]["Plan"]
+
+        yield explain
+        await session.rollback()
+
+
+def scans(plan: dict) -> list[tuple[str, str | None]]:
+    """
+    Returns the (node type, index name) of the scans of the plan
+    """
+    found = [(plan["Node Type"], plan.get("Index Name"))] if "Scan" in plan["Node Type"] else []
+    for child in plan.get("Plans", []):
+        found += scans(child)
+    return found
+
+
+def assert_index_scans(plan: dict, *indexes: str) -> None:
+    found = scans(plan)
+    assert all(node_type != "Seq Scan" for node_type, _ in found), json.dumps(plan, indent=2)
+    assert {index for _, index in found} & set(indexes), json.dumps(plan, indent=2)
+
+
+async def test_user_by_email(explain):
+    plan = await explain(select(User).where(User.email == "plan-42@example.com"))
+    assert_index_scans(plan, "app_user_email_key")
+
+
+async def test_emails_of_user(explain):
+    plan = await explain(select(Email).where(Email.user_id == USER_ID))
+    assert_index_scans(plan, "email_user_id_timestamp_idx", "email_user_id_gmail_message_id_key")
+
+
+async def test_gmail_emails_of_user_by_date(explain):
+    plan = await explain(
+        select(Email)
+        .where(Email.user_id == USER_ID, Email.gmail_message_id.is_not(None))
+        .order_by(Email.email_timestamp.desc())
+    )
+    assert_index_scans(plan, "email_user_id_timestamp_idx", "email_user_id_gmail_message_id_key")
+
+
+async def test_email_by_gmail_message_id(explain):
+    plan = await explain(select(Email).where(Email.user_id == USER_ID, Email.gmail_message_id == "g1001"))
+    assert_index_scans(plan, "email_user_id_gmail_message_id_key")
+
+
+async def test_tasks_of_user(explain):
+    plan = await explain(select(Task).join(Email, Task.email_id == Email.email_id).where(Email.user_id == USER_ID))
+    assert_index_scans(plan, "task_email_id_idx")
+
+
+async def test_invoices_of_user(explain):
+    plan = await explain(select(Invoice).where(Invoice.creator_id == USER_ID))
+    assert_index_scans(plan, "invoice_creator_id_idx")
+
+
+async def test_gmail_sync_cursor(explain):
+    plan = await explain(select(GmailSync.history_id).where(GmailSync.user_id == USER_ID))
+    assert_index_scans(plan, "gmail_sync_pkey")
+
+
+async def test_unsummarised_emails(explain):
+    plan = await explain(
+        select(Email.email_id, Email.full_content)
+        .where(Email.summary.is_(None), Email.full_content.is_not(None))
+        .order_by(Email.email_id)
+        .limit(100)
+    )
+    assert_index_scans(plan, "email_unsummarised_idx")
+
+
+async def test_summaries_by_content_hash(explain):
+    plan = await explain(
+        select(EmailSummary.content_hash, EmailSummary.summary)
+        .where(EmailSummary.content_hash.in_([f"hash-{i}" for i in range(100)]))
+    )
+    assert_index_scans(plan, "email_summary_pkey")
+
+
+async def test_llm_cache_lookup(explain):
+    plan = await explain(
+        select(LLMCacheEntry.response, LLMCacheEntry.tokens)
+        .where(LLMCacheEntry.cache_key == "key", LLMCacheEntry.expires_at > NOW)
+    )
+    assert_index_scans(plan, "llm_cache_pkey")
+
+
+async def test_llm_cache_semantic_lookup(explain):
+    distance = LLMCacheEntry.embedding.cosine_distance(np.full(1024, 0.5))
+    plan = await explain(
+        select(LLMCacheEntry.response, LLMCacheEntry.tokens, distance)
+        .where(
+            LLMCacheEntry.template == "intent",
+            LLMCacheEntry.llm_hash == "llm",
+            LLMCacheEntry.expires_at > NOW,
+            LLMCacheEntry.embedding.is_not(None)
+        )
+        .order_by(distance)
+        .limit(1)
+    )
+    assert_index_scans(plan, "llm_cache_embedding_idx")
+
+
+async def test_llm_cache_purge_of_expired(explain):
+    plan = await explain(delete(LLMCacheEntry).where(LLMCacheEntry.expires_at <= NOW - timedelta(seconds=1)))
+    assert_index_scans(plan, "llm_cache_expires_at_idx")
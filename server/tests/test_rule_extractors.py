@@ -0,0 +1,17 @@
+import pytest
+
+from app.services.chatbot.rule_extractors import parse_phone_number
+
+
+@pytest.mark.parametrize("message, phone_number", [
+    ("my phone is 0412345678", "0412345678"),
+    ("call me on 0412345678", "0412345678"),
+    ("invoice for bob, +61 412 345 678, $250", "+61 412 345 678"),
+    ("reach me at (02) 9876-5432", "(02) 9876-5432"),
+    ("invoice for order 12345678", None),
+    ("bob, 0412345678, for the chairs", None),
+    ("phone 0412345678 or 0498765432", None),
+    ("on 2024-05-01 for $1,250.00", None),
+])
+def test_parse_phone_number(message, phone_number):
+    assert parse_phone_number(message) == phone_number
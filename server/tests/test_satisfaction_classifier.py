@@ -0,0 +1,28 @@
+import pytest
+
+from app.services.chatbot.satisfaction_classifier import classify_email_satisfaction
+
+
+@pytest.mark.parametrize("message", [
+    "yes", "looks good, send it", "perfect 👍", "lgtm",
+    "no changes needed", "no changes", "don't change anything", "no problem", "no edits needed",
+    "not bad", "not bad at all", "why not", "Why not?", "no problem, send it",
+])
+def test_satisfied(message):
+    assert classify_email_satisfaction(message) == "True"
+
+
+@pytest.mark.parametrize("message", [
+    "no", "nope", "make it shorter", "change the subject", "no, change the subject", "wrong recipient",
+])
+def test_not_satisfied(message):
+    assert classify_email_satisfaction(message) == "False"
+
+
+@pytest.mark.parametrize("message", [
+    "yes but shorter", "not bad, make it shorter", "good, can you add a greeting?",
+    "no changes to the subject, remove the last line",
+    "the second paragraph repeats what the first one says, I would rather have one short paragraph",
+])
+def test_ambiguous(message):
+    assert classify_email_satisfaction(message) is None